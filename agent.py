@@ -68,6 +68,7 @@ class Agent:
         self.cellsInRange = {}
         self.childEndowmentHashes = None
         self.conflictHappiness = 0
+        self.currentDebt = None
         self.depressed = False
         self.diseaseDeath = False
         self.diseases = []
@@ -79,6 +80,8 @@ class Agent:
         self.happinessUnit = 1
         self.happinessModifier = 0
         self.healthHappiness = 0
+        # Immune system packed with its first bit lowest so disease windows are compared with a single XOR
+        self.immuneSystemBits = sum(bit << i for i, bit in enumerate(self.immuneSystem)) if self.immuneSystem != None else None
         self.lastCombatTimestep = -1
         self.lastDiseasesSpread = 0
         self.lastLendedTimestep = -1
@@ -99,15 +102,18 @@ class Agent:
         self.lastUniversalSpiceIncomeTimestep = 0
         self.lastUniversalSugarIncomeTimestep = 0
         self.lastValidMoves = 0
+        self.loansDue = {}
+        self.loansTaken = 0
         self.marginalRateOfSubstitution = 1
         self.movementModifier = 0
         self.movementNeighborhood = []
+        self.movePlan = None
         self.neighborhood = []
         self.neighbors = []
         self.nice = 0
         self.race = self.findRace()
         self.socialHappiness = 0
-        self.socialNetwork = {"father": None, "mother": None, "children": [], "friends": [], "creditors": [], "debtors": [], "mates": []}
+        self.socialNetwork = {"father": None, "mother": None, "children": [], "friends": [], "creditors": {}, "debtors": {}, "mates": []}
         self.spiceMeanIncome = 1
         self.spiceMetabolismModifier = 0
         self.spicePrice = 0
@@ -192,19 +198,26 @@ class Agent:
         if agentID not in self.socialNetwork:
             self.addAgentToSocialNetwork(agent)
         self.socialNetwork[agentID]["timesLoaned"] += 1
+        self.loansTaken += 1
+        # Loans are keyed by debtor and loan count so both sides can remove the same loan without searching for it
+        loanID = (self.ID, self.loansTaken)
         loan = {"creditor": agent, "debtor": self, "sugarLoan": sugarLoan, "spiceLoan": spiceLoan, "loanDuration": duration,
-                "loanOrigin": timestep}
-        self.socialNetwork["creditors"].append(loan)
+                "loanOrigin": timestep, "loanID": loanID}
+        self.socialNetwork["creditors"][loanID] = loan
+        loanDue = timestep + duration
+        if loanDue not in self.loansDue:
+            self.loansDue[loanDue] = {}
+        self.loansDue[loanDue][loanID] = loan
+        self.currentDebt = None
+        return loan
 
     def addLoanToAgent(self, agent, timestep, sugarPrincipal, sugarLoan, spicePrincipal, spiceLoan, duration):
         agentID = agent.ID
         if agentID not in self.socialNetwork:
             self.addAgentToSocialNetwork(agent)
         self.socialNetwork[agentID]["timesLoaned"] += 1
-        agent.addLoanFromAgent(self, timestep, sugarLoan, spiceLoan, duration)
-        loan = {"creditor": self, "debtor": agent, "sugarLoan": sugarLoan, "spiceLoan": spiceLoan, "loanDuration": duration,
-                "loanOrigin": timestep}
-        self.socialNetwork["debtors"].append(loan)
+        loan = agent.addLoanFromAgent(self, timestep, sugarLoan, spiceLoan, duration)
+        self.socialNetwork["debtors"][loan["loanID"]] = loan
         self.sugar -= sugarPrincipal
         self.spice -= spicePrincipal
         agent.sugar = agent.sugar + sugarPrincipal
@@ -259,7 +272,7 @@ class Agent:
         self.cell.resetSpice()
 
     def defaultOnLoan(self, loan):
-        for creditor in self.socialNetwork["creditors"]:
+        for creditor in self.socialNetwork["creditors"].values():
             continue
         return
 
@@ -304,6 +317,9 @@ class Agent:
             self.diseaseDeath = True
         self.resetCell()
         self.doInheritance()
+        # Creditors cannot collect on debt since debtor is dead
+        for loan in self.socialNetwork["creditors"].values():
+            loan["creditor"].removeDebt(loan)
 
         self.neighbors = []
         self.neighborhood = []
@@ -327,19 +343,20 @@ class Agent:
             if diseaseTags != None:
                 immuneResponseStart = diseaseRecord["startIndex"]
                 immuneResponseEnd = min(diseaseRecord["endIndex"] + 1, len(self.immuneSystem))
-                immuneResponse = self.immuneSystem[immuneResponseStart:immuneResponseEnd]
-                for i in range(len(immuneResponse)):
-                    if immuneResponse[i] != diseaseTags[i]:
-                        self.immuneSystem[immuneResponseStart + i] = diseaseTags[i]
-                        break
-                if diseaseTags == immuneResponse:
+                immuneResponseLength = immuneResponseEnd - immuneResponseStart
+                immuneResponseMismatches = ((self.immuneSystemBits >> immuneResponseStart) ^ disease.tagBits) & ((1 << immuneResponseLength) - 1)
+                # Flip the first mismatched bit, recovering only once the response already matched before this timestep
+                if immuneResponseMismatches != 0:
+                    i = (immuneResponseMismatches & -immuneResponseMismatches).bit_length() - 1
+                    self.flipImmuneSystemBit(immuneResponseStart + i, diseaseTags[i])
+                elif immuneResponseLength == len(diseaseTags):
                     self.diseases.remove(diseaseRecord)
                     disease.recover(self)
 
         diseaseCount = len(self.diseases)
         if diseaseCount == 0:
             return
-        neighborCells = self.cell.neighbors.values()
+        neighborCells = self.cell.neighbors
         neighbors = []
         for neighborCell in neighborCells:
             neighbor = neighborCell.agent
@@ -501,7 +518,7 @@ class Agent:
         # Agent marked for removal or not interested in reproduction should not reproduce
         if self.isAlive() == False or self.isFertile() == False:
             return
-        neighborCells = list(self.cell.neighbors.values())
+        neighborCells = list(self.cell.neighbors)
         random.shuffle(neighborCells)
         emptyCells = self.findEmptyNeighborCells()
         mates = []
@@ -556,7 +573,7 @@ class Agent:
     def doTagging(self):
         if self.tags == None or self.isAlive() == False or self.tagging == False:
             return
-        neighborCells = list(self.cell.neighbors.values())
+        neighborCells = list(self.cell.neighbors)
         random.shuffle(neighborCells)
         for neighborCell in neighborCells:
             neighbor = neighborCell.agent
@@ -577,6 +594,14 @@ class Agent:
             self.updateNeighbors()
             # Middle of timestep actions
             self.collectResourcesAtCell()
+            # Phased timesteps leave income, metabolism, and aging to a single pass over all agents once every agent has acted
+            if self.cell.environment.sugarscape.agentTimestepMode == "phased":
+                self.doTagging()
+                self.doTrading()
+                self.doReproduction()
+                self.doLending()
+                self.doDisease()
+                return
             self.doUniversalIncome()
             self.doMetabolism()
             # If dead from metabolism, skip remainder of timestep
@@ -597,15 +622,23 @@ class Agent:
             self.updateRuntimeStats()
             self.updateValues()
 
+    def doTradeTransaction(self, spiceSeller, sugarSeller, sugarPrice, spicePrice):
+        spiceSeller.sugar += sugarPrice
+        spiceSeller.spice -= spicePrice
+        sugarSeller.sugar -= sugarPrice
+        sugarSeller.spice += spicePrice
+        spiceSeller.findMarginalRateOfSubstitution()
+        sugarSeller.findMarginalRateOfSubstitution()
+
     def doTrading(self):
-        # If not a trader, skip trading
-        if self.tradeFactor == 0:
+        # If not a trader or trading in the market once every agent has acted, skip trading
+        if self.tradeFactor == 0 or self.cell.environment.sugarscape.agentTradeMode == "market":
             return
         self.tradeVolume = 0
         self.sugarPrice = 0
         self.spicePrice = 0
         self.findMarginalRateOfSubstitution()
-        neighborCells = self.cell.neighbors.values()
+        neighborCells = self.cell.neighbors
         potentialTraders = []
         for neighborCell in neighborCells:
             neighbor = neighborCell.agent
@@ -620,6 +653,7 @@ class Agent:
             sugarSeller = None
             tradeFlag = True
             transactions = 0
+            welfarePreferences = {}
 
             while tradeFlag == True:
                 traderMRS = trader.marginalRateOfSubstitution
@@ -635,54 +669,17 @@ class Agent:
                 else:
                     spiceSeller = self
                     sugarSeller = trader
-                spiceSellerMRS = spiceSeller.marginalRateOfSubstitution
-                sugarSellerMRS = sugarSeller.marginalRateOfSubstitution
 
-                if spiceSellerMRS < 0 or sugarSellerMRS < 0:
+                if spiceSeller.marginalRateOfSubstitution < 0 or sugarSeller.marginalRateOfSubstitution < 0:
                     spiceSeller = None
                     sugarSeller = None
                     break
 
-                # Find geometric mean of spice and sugar seller MRS for trade price
-                tradePrice = math.sqrt(spiceSellerMRS * sugarSellerMRS)
-                sugarPrice = 0
-                spicePrice = 0
-                # Set proper highest value commodity based on trade price
-                if tradePrice < 1:
-                    spicePrice = 1
-                    sugarPrice = tradePrice
-                else:
-                    spicePrice = tradePrice
-                    sugarPrice = 1
-
-                # If trade would be lethal, skip it
-                if spiceSeller.spice - spicePrice < spiceSeller.spiceMetabolism or sugarSeller.sugar - sugarPrice < sugarSeller.sugarMetabolism:
-                    tradeFlag = False
-                    continue
-                spiceSellerNewMRS = spiceSeller.findNewMarginalRateOfSubstitution(spiceSeller.sugar + sugarPrice, spiceSeller.spice - spicePrice)
-                sugarSellerNewMRS = sugarSeller.findNewMarginalRateOfSubstitution(sugarSeller.sugar - sugarPrice, sugarSeller.spice + spicePrice)
-
-                # Calculate absolute difference from perfect spice/sugar parity in MRS and change in agent welfare
-                betterSpiceSellerMRS = abs(1 - spiceSellerMRS) > abs(1 - spiceSellerNewMRS)
-                betterSugarSellerMRS = abs(1 - sugarSellerMRS) > abs(1 - sugarSellerNewMRS)
-                betterSpiceSellerWelfare = spiceSeller.findWelfare(sugarPrice, (-1 * spicePrice)) >= spiceSeller.findWelfare(0, 0)
-                betterSugarSellerWelfare = sugarSeller.findWelfare((-1 * sugarPrice), spicePrice) >= sugarSeller.findWelfare(0, 0)
-                # If either MRS or welfare is improved, mark the trade as better for agent
-                betterForSpiceSeller = betterSpiceSellerMRS or betterSpiceSellerWelfare
-                betterForSugarSeller = betterSugarSellerMRS or betterSugarSellerWelfare
-
-                # Check that spice seller's new MRS does not cross over sugar seller's new MRS
-                # Evaluates to False for successful trades
-                checkForMRSCrossing = spiceSellerNewMRS < sugarSellerNewMRS
-                if betterForSpiceSeller == True and betterForSugarSeller == True and checkForMRSCrossing == False:
+                sugarPrice, spicePrice = self.findTradePrices(spiceSeller, sugarSeller)
+                if self.isTradeAcceptable(spiceSeller, sugarSeller, sugarPrice, spicePrice, welfarePreferences) == True:
                     if "all" in self.debug or "agent" in self.debug:
                         print(f"Agent {self.ID} trading [{sugarPrice}, {spicePrice}]")
-                    spiceSeller.sugar += sugarPrice
-                    spiceSeller.spice -= spicePrice
-                    sugarSeller.sugar -= sugarPrice
-                    sugarSeller.spice += spicePrice
-                    spiceSeller.findMarginalRateOfSubstitution()
-                    sugarSeller.findMarginalRateOfSubstitution()
+                    self.doTradeTransaction(spiceSeller, sugarSeller, sugarPrice, spicePrice)
                     transactions += 1
                 else:
                     tradeFlag = False
@@ -705,6 +702,21 @@ class Agent:
         if self.lastTradeTimestep == self.timestep:
             self.lastTradePartners = len(tradePartners)
 
+    def doUpkeep(self):
+        self.doUniversalIncome()
+        self.doMetabolism()
+        # If dead from metabolism, skip remainder of timestep
+        if self.alive == False:
+            return
+        self.doAging()
+        # If dead from aging, skip remainder of timestep
+        if self.alive == False:
+            return
+        self.findCellsInRange()
+        self.updateHappiness()
+        self.updateRuntimeStats()
+        self.updateValues()
+
     def doUniversalIncome(self):
         if (self.timestep - self.lastUniversalSpiceIncomeTimestep) >= self.cell.environment.universalSpiceIncomeInterval:
             self.spice += self.universalSpice
@@ -722,6 +734,8 @@ class Agent:
         leader = self.cell.environment.sugarscape.agentLeader
         if self.follower == True and leader != None:
             return leader.findBestCellForAgent(self)
+        if self.movePlan != None:
+            return self.findPlannedCell()
 
         bestCell = None
         potentialCells = self.rankCellsInRange()
@@ -745,6 +759,10 @@ class Agent:
         self.lastValidMoves = len(potentialCells)
         return bestCell
 
+    def findBestCellByWealth(self, cells):
+        # Cell sortCellsByWealth would place first, found without sorting
+        return min(cells, key=self.findCellWealthOrder)
+
     def findBestEthicalCell(self, cells, greedyBestCell=None):
         if len(cells) == 0:
             return None
@@ -763,17 +781,22 @@ class Agent:
                 minHammingDistance = friend["hammingDistance"]
         return bestFriend
 
-    def findCellsInRange(self, newCell=None):
-        cell = self.cell if newCell == None else newCell
+    def findCellRange(self):
         vision = self.findVision()
         movement = self.findMovement()
-        cellRange = min(min(vision, movement), self.cell.environment.maxCellDistance)
+        return min(min(vision, movement), self.cell.environment.maxCellDistance)
+
+    def findCellWealthOrder(self, cell):
+        return (-1 * cell["wealth"], cell["range"])
+
+    def findCellsInRange(self, newCell=None):
+        cell = self.cell if newCell == None else newCell
+        cellRange = self.findCellRange()
         allCells = {}
         if cellRange <= 0:
             self.cellsInRange = allCells
             return allCells
-        for i in range(1, cellRange + 1):
-            allCells.update(cell.ranges[i])
+        allCells = cell.environment.findCellsInRange(cell, cellRange)
         if newCell == None:
             self.cellsInRange = allCells
         return allCells
@@ -917,21 +940,26 @@ class Agent:
                 return self.happinessUnit * -1
         return 0
 
+    def findCurrentDebt(self):
+        # Debt is kept until a loan is taken out or removed, summing loans in the same order as they were taken out
+        if self.currentDebt == None:
+            sugarDebt = 0
+            spiceDebt = 0
+            for creditor in self.socialNetwork["creditors"].values():
+                sugarDebt += creditor["sugarLoan"] / creditor["loanDuration"]
+                spiceDebt += creditor["spiceLoan"] / creditor["loanDuration"]
+            self.currentDebt = (sugarDebt, spiceDebt)
+        return self.currentDebt
+
     def findCurrentSpiceDebt(self):
-        spiceDebt = 0
-        for creditor in self.socialNetwork["creditors"]:
-            spiceDebt += creditor["spiceLoan"] / creditor["loanDuration"]
-        return spiceDebt
+        return self.findCurrentDebt()[1]
 
     def findCurrentSugarDebt(self):
-        sugarDebt = 0
-        for creditor in self.socialNetwork["creditors"]:
-            sugarDebt += creditor["sugarLoan"] / creditor["loanDuration"]
-        return sugarDebt
+        return self.findCurrentDebt()[0]
 
     def findEmptyNeighborCells(self):
         emptyCells = []
-        neighborCells = self.cell.neighbors.values()
+        neighborCells = self.cell.neighbors
         for neighborCell in neighborCells:
             if neighborCell.agent == None:
                 emptyCells.append(neighborCell)
@@ -961,15 +989,19 @@ class Agent:
         potentialNeighbors = cell.findNeighborAgents()
         modifier = 1
         if len(potentialNeighbors) > 0:
+            environment = self.cell.environment
             inGroupAge = 0
             inGroupRace = 0
             inGroupSex = 0
             inGroupTribe = 0
+            # Racial tags never change, so race is always the one found at birth
+            race = self.race
+            tribe = self.findTribe()
             for neighbor in potentialNeighbors:
                 neighborAge = neighbor.age
-                inRelativeAgeRange = abs(neighborAge - self.age) <= self.cell.environment.inGroupAgeRelativeRange
+                inRelativeAgeRange = abs(neighborAge - self.age) <= environment.inGroupAgeRelativeRange
                 inAbsoluteAgeRanges = False
-                for minAge, maxAge in self.cell.environment.inGroupAgeAbsoluteRanges:
+                for minAge, maxAge in environment.inGroupAgeAbsoluteRanges:
                     if neighborAge >= minAge and (neighborAge <= maxAge or maxAge == -1):
                         inAbsoluteAgeRanges = True
                         break
@@ -977,12 +1009,12 @@ class Agent:
                 if inRelativeAgeRange or inAbsoluteAgeRanges:
                     inGroupAge += 1
 
-                neighborRace = neighbor.findRace()
-                if neighborRace == self.findRace() or neighborRace in self.cell.environment.inGroupRaces:
+                neighborRace = neighbor.race
+                if neighborRace == race or neighborRace in environment.inGroupRaces:
                     inGroupRace += 1
                 if neighbor.sex == self.sex:
                     inGroupSex += 1
-                if neighbor.findTribe() == self.findTribe():
+                if neighbor.findTribe() == tribe:
                     inGroupTribe += 1
             
             # Increase value of cell according to proportion of in-group neighbors
@@ -1034,18 +1066,20 @@ class Agent:
     def findNearestHammingDistanceInDisease(self, disease):
         if self.immuneSystem == None or disease.tags == None:
             return 0
-        diseaseTags = disease.tags
-        diseaseLength = len(diseaseTags)
+        diseaseTags = disease.tagBits
+        diseaseLength = len(disease.tags)
+        diseaseMask = (1 << diseaseLength) - 1
+        immuneSystem = self.immuneSystemBits
         bestHammingDistance = diseaseLength
         bestRange = [0, diseaseLength - 1]
         for i in range(len(self.immuneSystem) - diseaseLength):
-            hammingDistance = 0
-            for j in range(diseaseLength):
-                if self.immuneSystem[i + j] != diseaseTags[j]:
-                    hammingDistance += 1
+            hammingDistance = bin(((immuneSystem >> i) & diseaseMask) ^ diseaseTags).count("1")
             if hammingDistance < bestHammingDistance:
                 bestHammingDistance = hammingDistance
                 bestRange = [i, i + (diseaseLength - 1)]
+                # No later window can be nearer than an exact match
+                if hammingDistance == 0:
+                    break
         diseaseStats = {"distance": bestHammingDistance, "start": bestRange[0], "end": bestRange[1]}
         return diseaseStats
 
@@ -1053,7 +1087,8 @@ class Agent:
         if newCell == None:
             newNeighborhood = self.cellsInRange
         else:
-            newNeighborhood = self.findCellsInRange(newCell)
+            # Only occupied cells can contribute to a neighborhood
+            newNeighborhood = newCell.environment.findOccupiedCellsInRange(newCell, self.findCellRange())
         neighborhood = []
         for neighborCell in newNeighborhood.keys():
             neighbor = neighborCell.agent
@@ -1079,6 +1114,34 @@ class Agent:
             return 1 / sugarMetabolism
         return spiceNeed / sugarNeed
 
+    def findPlannedCell(self):
+        movePlan = self.movePlan
+        self.movePlan = None
+        for attribute, value in movePlan["state"].items():
+            setattr(self, attribute, value)
+        self.neighborhood = movePlan["neighborhood"]
+        rankedCells = movePlan["rankedCells"]
+        self.updateMovementStats(rankedCells)
+        # Fall back to the next preferred cell when an agent moving earlier this timestep has taken it
+        bestCell = self.cell
+        for cell, occupant in movePlan["preferredCells"]:
+            if cell == self.cell or cell.agent == None or (cell.agent == occupant and self.isNeighborValidPrey(cell.agent) == True):
+                bestCell = cell
+                break
+        if bestCell == rankedCells[0]["cell"]:
+            self.lastMoveOptimal = True
+        else:
+            self.lastMoveOptimal = False
+        bestCellRank = 0
+        for cell in rankedCells:
+            if cell["cell"] != bestCell:
+                bestCellRank += 1
+            else:
+                break
+        self.lastMoveRank = bestCellRank
+        self.lastValidMoves = len(rankedCells)
+        return bestCell
+
     def findRace(self):
         if self.racialTags == None:
             return None
@@ -1139,6 +1202,14 @@ class Agent:
             self.timeToLive = timeToLive
         return timeToLive
 
+    def findTradePrices(self, spiceSeller, sugarSeller):
+        # Find geometric mean of spice and sugar seller MRS for trade price
+        tradePrice = math.sqrt(spiceSeller.marginalRateOfSubstitution * sugarSeller.marginalRateOfSubstitution)
+        # Set proper highest value commodity based on trade price
+        if tradePrice < 1:
+            return (tradePrice, 1)
+        return (1, tradePrice)
+
     def findTribe(self):
         if self.tags == None:
             return None
@@ -1150,9 +1221,9 @@ class Agent:
         tribe = min(math.ceil((self.tagZeroes + 1) / tribeSize) - 1, numTribes - 1)
         return tribe
 
-    def findValueOfCell(self, cell, preySugar, preySpice):
+    def findValueOfCell(self, cell, preySugar, preySpice, welfarePreferences=None):
         # Modify value of cell relative to the metabolism needs of the agent
-        value = self.findWelfare(((cell.sugar + preySugar) / (1 + cell.pollution)), ((cell.spice + preySpice) / (1 + cell.pollution)))
+        value = self.findWelfare(((cell.sugar + preySugar) / (1 + cell.pollution)), ((cell.spice + preySpice) / (1 + cell.pollution)), welfarePreferences)
         if self.decisionModelAgeismFactor >= 0 or self.decisionModelRacismFactor >= 0 or (self.sex in self.cell.environment.sexistGroups and self.decisionModelSexismFactor >= 0) or self.decisionModelTribalFactor >= 0:
             # Modify welfare according to group preferences
             value *= self.findGroupBiasCellWelfareModifier(cell)
@@ -1167,7 +1238,20 @@ class Agent:
         diffWealth *= self.happinessUnit
         return math.erf(diffWealth)
 
-    def findWelfare(self, sugarReward, spiceReward):
+    def findWelfare(self, sugarReward, spiceReward, welfarePreferences=None):
+        if welfarePreferences == None:
+            welfarePreferences = self.findWelfarePreferences()
+        sugarLookahead, spiceLookahead, sugarPreference, spicePreference = welfarePreferences
+        totalSugar = (self.sugar + sugarReward) - sugarLookahead
+        totalSpice = (self.spice + spiceReward) - spiceLookahead
+        if totalSugar < 0:
+            totalSugar = 0
+        if totalSpice < 0:
+            totalSpice = 0
+        welfare = (totalSugar ** sugarPreference) * (totalSpice ** spicePreference)
+        return welfare
+
+    def findWelfarePreferences(self):
         spiceMetabolism = self.findSpiceMetabolism()
         sugarMetabolism = self.findSugarMetabolism()
         totalMetabolism = sugarMetabolism + spiceMetabolism
@@ -1179,14 +1263,6 @@ class Agent:
 
         sugarLookahead = sugarMetabolism * self.lookaheadFactor
         spiceLookahead = spiceMetabolism * self.lookaheadFactor
-        totalSugar = (self.sugar + sugarReward) - sugarLookahead
-        totalSpice = (self.spice + spiceReward) - spiceLookahead
-        if totalSugar < 0:
-            totalSugar = 0
-        if totalSpice < 0:
-            totalSpice = 0
-
-        welfare = (totalSugar ** sugarMetabolismProportion) * (totalSpice ** spiceMetabolismProportion)
         if self.tagPreferences == True and self.tags != None and len(self.tags) > 0:
             # Tribe could have changed since last timestep, so recheck
             self.tribe = self.findTribe()
@@ -1197,8 +1273,12 @@ class Agent:
                 tagPreferences = 1
             tagPreferencesSugar = (sugarMetabolism / tagPreferences) * fractionZeroesInTags
             tagPreferencesSpice = (spiceMetabolism / tagPreferences) * fractionOnesInTags
-            welfare = (totalSugar ** tagPreferencesSugar) * (totalSpice ** tagPreferencesSpice)
-        return welfare
+            return (sugarLookahead, spiceLookahead, tagPreferencesSugar, tagPreferencesSpice)
+        return (sugarLookahead, spiceLookahead, sugarMetabolismProportion, spiceMetabolismProportion)
+
+    def flipImmuneSystemBit(self, position, value):
+        self.immuneSystem[position] = value
+        self.immuneSystemBits ^= 1 << position
 
     def flipTag(self, position, value):
         self.tags[position] = value
@@ -1216,7 +1296,7 @@ class Agent:
             self.lastPollution = self.cell.pollution
         self.resetCell()
         self.cell = cell
-        self.cell.agent = self
+        self.cell.setAgent(self)
 
     def isAlive(self):
         if self.spice < 0 or self.sugar < 0:
@@ -1318,6 +1398,35 @@ class Agent:
             return True
         return False
 
+    def isTradeAcceptable(self, spiceSeller, sugarSeller, sugarPrice, spicePrice, welfarePreferences):
+        # If trade would be lethal, skip it
+        if spiceSeller.spice - spicePrice < spiceSeller.spiceMetabolism or sugarSeller.sugar - sugarPrice < sugarSeller.sugarMetabolism:
+            return False
+        spiceSellerMRS = spiceSeller.marginalRateOfSubstitution
+        sugarSellerMRS = sugarSeller.marginalRateOfSubstitution
+        spiceSellerNewMRS = spiceSeller.findNewMarginalRateOfSubstitution(spiceSeller.sugar + sugarPrice, spiceSeller.spice - spicePrice)
+        sugarSellerNewMRS = sugarSeller.findNewMarginalRateOfSubstitution(sugarSeller.sugar - sugarPrice, sugarSeller.spice + spicePrice)
+
+        # Welfare preferences do not change while trading, so find them once per trading pair
+        if spiceSeller not in welfarePreferences:
+            welfarePreferences[spiceSeller] = spiceSeller.findWelfarePreferences()
+        if sugarSeller not in welfarePreferences:
+            welfarePreferences[sugarSeller] = sugarSeller.findWelfarePreferences()
+        spiceSellerPreferences = welfarePreferences[spiceSeller]
+        sugarSellerPreferences = welfarePreferences[sugarSeller]
+
+        # Calculate absolute difference from perfect spice/sugar parity in MRS and change in agent welfare
+        betterSpiceSellerMRS = abs(1 - spiceSellerMRS) > abs(1 - spiceSellerNewMRS)
+        betterSugarSellerMRS = abs(1 - sugarSellerMRS) > abs(1 - sugarSellerNewMRS)
+        # If either MRS or welfare is improved, mark the trade as better for agent, only finding welfare when MRS is not improved
+        betterForSpiceSeller = betterSpiceSellerMRS or spiceSeller.findWelfare(sugarPrice, (-1 * spicePrice), spiceSellerPreferences) >= spiceSeller.findWelfare(0, 0, spiceSellerPreferences)
+        betterForSugarSeller = betterSugarSellerMRS or sugarSeller.findWelfare((-1 * sugarPrice), spicePrice, sugarSellerPreferences) >= sugarSeller.findWelfare(0, 0, sugarSellerPreferences)
+
+        # Check that spice seller's new MRS does not cross over sugar seller's new MRS
+        # Evaluates to False for successful trades
+        checkForMRSCrossing = spiceSellerNewMRS < sugarSellerNewMRS
+        return betterForSpiceSeller == True and betterForSugarSeller == True and checkForMRSCrossing == False
+
     def moveToBestCell(self, predeterminedMove=None):
         bestCell = self.findBestCell(predeterminedMove)
         if "all" in self.debug or "agent" in self.debug:
@@ -1331,7 +1440,7 @@ class Agent:
         creditor = loan["creditor"]
         if creditor.isAlive() == False:
             if creditor.inheritancePolicy != "children":
-                self.socialNetwork["creditors"].remove(loan)
+                self.removeLoanFromAgent(loan)
                 creditor.removeDebt(loan)
             else:
                 self.payDebtToCreditorChildren(loan)
@@ -1340,7 +1449,7 @@ class Agent:
             self.spice -= loan["spiceLoan"]
             creditor.sugar = creditor.sugar + loan["sugarLoan"]
             creditor.spice = creditor.spice + loan["spiceLoan"]
-            self.socialNetwork["creditors"].remove(loan)
+            self.removeLoanFromAgent(loan)
             creditor.removeDebt(loan)
         else:
             sugarPayout = self.sugar / 2
@@ -1354,7 +1463,7 @@ class Agent:
             creditorInterestRate = creditor.lendingFactor * creditor.baseInterestRate
             newSugarLoan = sugarRepaymentLeft + (creditorInterestRate * sugarRepaymentLeft)
             newSpiceLoan = spiceRepaymentLeft + (creditorInterestRate * spiceRepaymentLeft)
-            self.socialNetwork["creditors"].remove(loan)
+            self.removeLoanFromAgent(loan)
             creditor.removeDebt(loan)
             # Initiate new loan with interest compounded on previous loan and not transferring any new principal
             creditor.addLoanToAgent(self, self.lastMovedTimestep, 0, newSugarLoan, 0, newSpiceLoan, creditor.loanDuration)
@@ -1373,7 +1482,7 @@ class Agent:
             spiceRepayment = loan["spiceLoan"] / numLivingChildren
             for child in livingCreditorChildren:
                 child.addLoanToAgent(self, self.lastMovedTimestep, 0, sugarRepayment, 0, spiceRepayment, 1)
-        self.socialNetwork["creditors"].remove(loan)
+        self.removeLoanFromAgent(loan)
         creditor.removeDebt(loan)
 
     def printCellScores(self, cells):
@@ -1403,37 +1512,28 @@ class Agent:
         retaliators = self.findRetaliatorsInVision()
         combatMaxLoot = self.cell.environment.maxCombatLoot
         aggression = self.findAggression()
-
-        bestCell = None
-        bestWealth = 0
-        bestRange = max(self.cell.environment.height, self.cell.environment.width)
+        wealth = self.sugar + self.spice
+        # Metabolism and tag preferences are the same for every cell, so find them once for the whole range
+        welfarePreferences = self.findWelfarePreferences()
         potentialCells = []
 
         for cell, travelDistance in cellsInRange:
-            # Avoid attacking agents ineligible to attack
             prey = cell.agent
-            if cell.isOccupied() and self.isNeighborValidPrey(prey) == False:
-                continue
-            preyTribe = prey.tribe if prey != None else "empty"
-            preySugar = prey.sugar if prey != None else 0
-            preySpice = prey.spice if prey != None else 0
-            # Aggression factor may lead agent to see more reward than possible meaning combat itself is a reward
-            welfarePreySugar = aggression * min(combatMaxLoot, preySugar)
-            welfarePreySpice = aggression * min(combatMaxLoot, preySpice)
-            welfare = self.findValueOfCell(cell, welfarePreySugar, welfarePreySpice)
+            preySugar = 0
+            preySpice = 0
+            if prey != None:
+                # Avoid attacking agents ineligible to attack
+                if self.isNeighborValidPrey(prey) == False:
+                    continue
+                # Aggression factor may lead agent to see more reward than possible meaning combat itself is a reward
+                preySugar = aggression * min(combatMaxLoot, prey.sugar)
+                preySpice = aggression * min(combatMaxLoot, prey.spice)
+            welfare = self.findValueOfCell(cell, preySugar, preySpice, welfarePreferences)
 
             # Avoid attacking agents protected via retaliation
-            if prey != None and retaliators[preyTribe] > self.sugar + self.spice + welfare:
+            if prey != None and retaliators[prey.tribe] > wealth + welfare:
                 continue
-
-            # Select closest cell with the most resources
-            if welfare > bestWealth or (welfare == bestWealth and travelDistance < bestRange):
-                bestCell = cell
-                bestWealth = welfare
-                bestRange = travelDistance
-
-            cellRecord = {"cell": cell, "wealth": welfare, "range": travelDistance}
-            potentialCells.append(cellRecord)
+            potentialCells.append({"cell": cell, "wealth": welfare, "range": travelDistance})
 
         if len(potentialCells) == 0:
             potentialCells.append({"cell": self.cell, "wealth": 0, "range": 0})
@@ -1443,10 +1543,18 @@ class Agent:
         return rankedCells
 
     def removeDebt(self, loan):
-        for debtor in self.socialNetwork["debtors"]:
-            if debtor == loan:
-                self.socialNetwork["debtors"].remove(debtor)
-                return
+        loanID = loan["loanID"]
+        if loanID in self.socialNetwork["debtors"]:
+            del self.socialNetwork["debtors"][loanID]
+
+    def removeLoanFromAgent(self, loan):
+        loanID = loan["loanID"]
+        del self.socialNetwork["creditors"][loanID]
+        loanDue = loan["loanOrigin"] + loan["loanDuration"]
+        del self.loansDue[loanDue][loanID]
+        if len(self.loansDue[loanDue]) == 0:
+            del self.loansDue[loanDue]
+        self.currentDebt = None
 
     def resetCell(self):
         self.cell.resetAgent()
@@ -1477,16 +1585,8 @@ class Agent:
         self.socialNetwork["mother"] = mother
 
     def sortCellsByWealth(self, cells):
-        # Insertion sort of cells by wealth in descending order with range as a tiebreaker
-        i = 0
-        while i < len(cells):
-            j = i
-            while j > 0 and (cells[j - 1]["wealth"] < cells[j]["wealth"] or (cells[j - 1]["wealth"] == cells[j]["wealth"] and cells[j - 1]["range"] > cells[j]["range"])):
-                currCell = cells[j]
-                cells[j] = cells[j - 1]
-                cells[j - 1] = currCell
-                j -= 1
-            i += 1
+        # Stable sort of cells by wealth in descending order with range as a tiebreaker
+        cells.sort(key=self.findCellWealthOrder)
         return cells
 
     def spawnChild(self, childID, birthday, cell, configuration):
@@ -1530,15 +1630,12 @@ class Agent:
         self.happiness = self.findHappiness()
 
     def updateLoans(self):
-        for debtor in self.socialNetwork["debtors"]:
-            debtorAgent = debtor["debtor"]
-            # Cannot collect on debt since debtor is dead
-            if debtorAgent.isAlive() == False:
-                self.socialNetwork["debtors"].remove(debtor)
-        for creditor in self.socialNetwork["creditors"]:
-            timeRemaining = (self.lastMovedTimestep - creditor["loanOrigin"]) - creditor["loanDuration"]
-            if timeRemaining == 0:
-                self.payDebt(creditor)
+        # Loans are indexed by due timestep, so only loans due now are checked
+        if self.lastMovedTimestep not in self.loansDue:
+            return
+        # Paying a loan removes it from the index, so pay from a copy of the loans due
+        for loan in list(self.loansDue[self.lastMovedTimestep].values()):
+            self.payDebt(loan)
 
     def updateMarginalRateOfSubstitutionForAgent(self, agent):
         agentID = agent.ID
@@ -1561,7 +1658,7 @@ class Agent:
         self.movementNeighborhood = self.neighborhood[:]
 
     def updateNeighbors(self):
-        self.neighbors = [neighborCell.agent for neighborCell in self.cell.neighbors.values() if neighborCell.agent != None]
+        self.neighbors = [neighborCell.agent for neighborCell in self.cell.neighbors if neighborCell.agent != None]
         self.updateSocialNetwork()
 
     def updateRuntimeStats(self):
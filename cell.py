@@ -1,6 +1,8 @@
 import math
 
 class Cell:
+    __slots__ = ["agent", "environment", "hemisphere", "maxSpice", "maxSugar", "neighborAgents", "neighbors", "neighborWealth", "neighborWealthTimestep", "pollution", "pollutionFlux", "season", "spice", "spiceLastProduced", "sugar", "sugarLastProduced", "timestep", "x", "y"]
+
     def __init__(self, x, y, environment, maxSugar=0, maxSpice=0, growbackRate=0):
         self.x = x
         self.y = y
@@ -10,10 +12,12 @@ class Cell:
 
         self.agent = None
         self.hemisphere = "north" if self.x >= self.environment.equator else "south"
-        self.neighbors = {}
+        self.neighborAgents = None
+        self.neighbors = ()
+        self.neighborWealth = None
+        self.neighborWealthTimestep = 0
         self.pollution = 0
         self.pollutionFlux = 0
-        self.ranges = {}
         self.season = None
         self.spice = maxSpice
         self.spiceLastProduced = 0
@@ -51,28 +55,30 @@ class Cell:
         return eastNeighbor
 
     def findNeighborAgents(self):
-        agents = []
-        for neighbor in self.neighbors.values():
-            agent = neighbor.agent
-            if agent != None:
-                agents.append(agent)
-        return agents
+        # Neighbor agents are kept until an agent enters or leaves a neighboring cell
+        if self.neighborAgents == None:
+            agents = []
+            for neighbor in self.neighbors:
+                agent = neighbor.agent
+                if agent != None:
+                    agents.append(agent)
+            self.neighborAgents = agents
+        return self.neighborAgents
 
     def findNeighbors(self, mode):
-        self.neighbors = {}
-
+        neighbors = []
         north = self.findNorthNeighbor()
         south = self.findSouthNeighbor()
         east = self.findEastNeighbor()
         west = self.findWestNeighbor()
         if north is not None:
-            self.neighbors["north"] = north
+            neighbors.append(north)
         if south is not None:
-            self.neighbors["south"] = south
+            neighbors.append(south)
         if east is not None:
-            self.neighbors["east"] = east
+            neighbors.append(east)
         if west is not None:
-            self.neighbors["west"] = west
+            neighbors.append(west)
 
         if mode == "moore":
             northeast = north.findEastNeighbor() if north is not None else None
@@ -80,20 +86,25 @@ class Cell:
             southeast = south.findEastNeighbor() if south is not None else None
             southwest = south.findWestNeighbor() if south is not None else None
             if northeast is not None:
-                self.neighbors["northeast"] = northeast
+                neighbors.append(northeast)
             if northwest is not None:
-                self.neighbors["northwest"] = northwest
+                neighbors.append(northwest)
             if southeast is not None:
-                self.neighbors["southeast"] = southeast
+                neighbors.append(southeast)
             if southwest is not None:
-                self.neighbors["southwest"] = southwest
+                neighbors.append(southwest)
+        self.neighbors = tuple(neighbors)
 
     def findNeighborWealth(self):
-        neighborWealth = 0
-        for neighbor in self.neighbors.values():
-            if neighbor != None:
-                neighborWealth += neighbor.sugar + neighbor.spice
-        return neighborWealth
+        # Neighbor wealth is kept until the next regrowth or until a neighboring cell is harvested or edited
+        if self.neighborWealth == None or self.neighborWealthTimestep != self.environment.timestep:
+            neighborWealth = 0
+            for neighbor in self.neighbors:
+                if neighbor != None:
+                    neighborWealth += neighbor.sugar + neighbor.spice
+            self.neighborWealth = neighborWealth
+            self.neighborWealthTimestep = self.environment.timestep
+        return self.neighborWealth
 
     def findNorthNeighbor(self):
         if self.environment.wraparound == False and self.y - 1 < 0:
@@ -103,13 +114,13 @@ class Cell:
 
     def findPollutionFlux(self):
         meanPollution = 0
-        for neighbor in self.neighbors.values():
+        for neighbor in self.neighbors:
             meanPollution += neighbor.pollution
         meanPollution = meanPollution / (len(self.neighbors))
         self.pollutionFlux = meanPollution
 
     def findSouthNeighbor(self):
-        if self.environment.wraparound == False and self.y + 1 < self.environment.height - 1:
+        if self.environment.wraparound == False and self.y + 1 > self.environment.height - 1:
             return None
         southNeighbor = self.environment.findCell(self.x, (self.y + 1 + self.environment.height) % self.environment.height)
         return southNeighbor
@@ -128,12 +139,31 @@ class Cell:
 
     def resetAgent(self):
         self.agent = None
+        self.environment.updateOccupiedCell(self)
+        self.resetNeighborAgents()
+
+    def resetNeighborAgents(self):
+        for neighbor in self.neighbors:
+            neighbor.neighborAgents = None
+
+    def resetNeighborWealth(self):
+        for neighbor in self.neighbors:
+            neighbor.neighborWealth = None
 
     def resetSpice(self):
+        self.environment.wealthTotal -= self.spice
         self.spice = 0
+        self.resetNeighborWealth()
 
     def resetSugar(self):
+        self.environment.wealthTotal -= self.sugar
         self.sugar = 0
+        self.resetNeighborWealth()
+
+    def setAgent(self, agent):
+        self.agent = agent
+        self.environment.updateOccupiedCell(self)
+        self.resetNeighborAgents()
 
     def updateSeason(self):
         if self.season == "wet":
@@ -141,6 +171,12 @@ class Cell:
         else:
             self.season = "wet"
 
+    def __getstate__(self):
+        # Copy only slots holding their own values, since subclasses may keep cell state behind properties of the same name
+        cellClass = type(self)
+        slots = [slot for ancestor in cellClass.__mro__ for slot in getattr(ancestor, "__slots__", []) if isinstance(getattr(cellClass, slot), property) == False]
+        return (None, {slot: getattr(self, slot) for slot in slots if hasattr(self, slot) == True})
+
     def __str__(self):
         string = ""
         if self.agent != None:
@@ -148,3 +184,82 @@ class Cell:
         else:
             string = f"{str(self.sugar)}/{str(self.spice)}"
         return string
+
+def growbackProperty(name):
+    storedName = "stored" + name[0].upper() + name[1:]
+
+    def getValue(self):
+        if self.growbackTimestep != self.environment.timestep:
+            self.updateGrowback()
+        return getattr(self, storedName)
+
+    def setValue(self, value):
+        if self.growbackTimestep != self.environment.timestep:
+            self.updateGrowback()
+        setattr(self, storedName, value)
+        self.growbackSettled = False
+        self.environment.growingCells[self] = None
+
+    return property(getValue, setValue)
+
+# Cell which applies the regrowth of every timestep since it was last read or written only when next accessed
+class LazyCell(Cell):
+    __slots__ = ["growbackSettled", "growbackTimestep", "storedMaxSpice", "storedMaxSugar", "storedSeason", "storedSpice", "storedSpiceLastProduced", "storedSugar", "storedSugarLastProduced"]
+
+    def __init__(self, x, y, environment, maxSugar=0, maxSpice=0, growbackRate=0):
+        self.growbackSettled = False
+        self.growbackTimestep = environment.timestep
+        super().__init__(x, y, environment, maxSugar, maxSpice, growbackRate)
+
+    maxSpice = growbackProperty("maxSpice")
+    maxSugar = growbackProperty("maxSugar")
+    season = growbackProperty("season")
+    spice = growbackProperty("spice")
+    spiceLastProduced = growbackProperty("spiceLastProduced")
+    sugar = growbackProperty("sugar")
+    sugarLastProduced = growbackProperty("sugarLastProduced")
+
+    # Lazy cells are always current with the environment timestep
+    @property
+    def timestep(self):
+        return self.environment.timestep
+
+    @timestep.setter
+    def timestep(self, timestep):
+        pass
+
+    def doGrowback(self):
+        sugarRegrowRate = self.environment.sugarRegrowRate
+        spiceRegrowRate = self.environment.spiceRegrowRate
+        sugar = min(self.storedSugar + sugarRegrowRate, self.storedMaxSugar)
+        spice = min(self.storedSpice + spiceRegrowRate, self.storedMaxSpice)
+        sugarLastProduced = sugarRegrowRate if self.storedSugar + sugarRegrowRate != self.storedSugar else 0
+        spiceLastProduced = spiceRegrowRate if self.storedSpice + spiceRegrowRate != self.storedSpice else 0
+        # Once regrowth leaves a cell unchanged, every later regrowth will as well
+        growback = (sugar, spice, sugarLastProduced, spiceLastProduced)
+        storedGrowback = (self.storedSugar, self.storedSpice, self.storedSugarLastProduced, self.storedSpiceLastProduced)
+        if [(type(value), value) for value in growback] == [(type(value), value) for value in storedGrowback]:
+            self.growbackSettled = True
+            self.environment.growingCells.pop(self, None)
+        self.environment.wealthCreated += sugarLastProduced + spiceLastProduced - self.storedSugarLastProduced - self.storedSpiceLastProduced
+        self.environment.wealthTotal += sugar + spice - self.storedSugar - self.storedSpice
+        self.storedSugar = sugar
+        self.storedSpice = spice
+        self.storedSugarLastProduced = sugarLastProduced
+        self.storedSpiceLastProduced = spiceLastProduced
+
+    def updateGrowback(self):
+        environment = self.environment
+        seasonInterval = environment.seasonInterval
+        while self.growbackTimestep < environment.timestep and self.growbackSettled == False:
+            timestep = self.growbackTimestep + 1
+            season = self.storedSeason
+            if seasonInterval > 0 and timestep % seasonInterval == 0:
+                self.storedSeason = "dry" if season == "wet" else "wet"
+            if environment.isGrowbackTimestep(season, timestep) == True:
+                self.doGrowback()
+            self.growbackTimestep = timestep
+        # Only the season of a settled cell can still change, so flip it once for every season change skipped
+        if seasonInterval > 0 and (environment.timestep // seasonInterval - self.growbackTimestep // seasonInterval) % 2 == 1:
+            self.storedSeason = "dry" if self.storedSeason == "wet" else "wet"
+        self.growbackTimestep = environment.timestep
@@ -5,6 +5,7 @@ class Condition:
         self.ID = conditionID
         self.configuration = configuration
         self.recoverable = False
+        self.tagBits = None
         self.tags = None
 
     def __str__(self):
@@ -46,6 +47,8 @@ class Disease(Condition):
         self.spiceMetabolismPenalty = configuration["spiceMetabolismPenalty"]
         self.startTimestep = configuration["startTimestep"]
         self.sugarMetabolismPenalty = configuration["sugarMetabolismPenalty"]
+        # Tags packed with their first bit lowest to match agent immune systems
+        self.tagBits = sum(bit << i for i, bit in enumerate(configuration["tags"])) if configuration["tags"] != None else None
         self.tags = configuration["tags"]
         self.transmissionChance = configuration["transmissionChance"]
         self.visionPenalty = configuration["visionPenalty"]
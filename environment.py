@@ -10,6 +10,7 @@ class Environment:
         self.equator = configuration["equator"] if configuration["equator"] >= 0 else math.ceil(self.height / 2)
         self.globalMaxSpice = configuration["globalMaxSpice"]
         self.globalMaxSugar = configuration["globalMaxSugar"]
+        self.growbackMode = configuration["growbackMode"]
         self.inGroupAgeAbsoluteRanges = configuration["ageistAbsoluteRanges"]
         self.inGroupAgeRelativeRange = configuration["ageistRelativeRange"]
         self.inGroupRaces = configuration["inGroupRaces"]
@@ -21,6 +22,7 @@ class Environment:
         self.pollutionDiffusionStart = configuration["pollutionDiffusionTimeframe"][0]
         self.pollutionEnd = configuration["pollutionTimeframe"][1]
         self.pollutionStart = configuration["pollutionTimeframe"][0]
+        self.resourceGrid = None
         self.seasonalGrowbackCountdown = configuration["seasonalGrowbackDelay"]
         self.seasonalGrowbackDelay = configuration["seasonalGrowbackDelay"]
         self.seasonInterval = configuration["seasonInterval"]
@@ -37,42 +39,64 @@ class Environment:
         self.universalSpiceIncomeInterval = configuration["universalSpiceIncomeInterval"]
         self.universalSugarIncomeInterval = configuration["universalSugarIncomeInterval"]
         self.wraparound = configuration["wraparound"]
+        self.cellRangeLookup = {}
+        self.cellRangeSizes = []
+        self.cellRangeViewLimit = 1000000
+        self.cellRangeViews = {}
+        self.cellRangeViewSize = 0
+        self.cellRanges = {}
+        self.growingCells = {}
         self.maxCellDistance = 0
+        self.maxWealthTotal = 0
+        self.occupancyBucketSize = 1
+        self.occupancyBucketSpans = {}
+        self.occupancyBuckets = []
+        self.occupiedCellCount = 0
         self.timestep = 0
+        self.wealthCreated = 0
+        self.wealthExact = True
+        self.wealthTotal = 0
 
         # Populate grid with NoneType objects
         self.grid = [[None for j in range(height)]for i in range(width)]
 
-    def createDistanceTable(self, maxDeltaX, maxDeltaY):
-        distanceTable = {}
-        lowerMax = min(maxDeltaX, maxDeltaY)
-        upperMax = max(maxDeltaX, maxDeltaY)
-        lowerBorder = self.width if lowerMax == maxDeltaX else self.height
-        upperBorder = self.width if lowerMax == maxDeltaY else self.height
-        for lowerDelta in range(lowerMax + 1):
-            for upperDelta in range(max(1, lowerDelta), upperMax + 1):
-                lowerDelta = self.findWraparoundDistance(lowerDelta, lowerBorder)
-                upperDelta = self.findWraparoundDistance(upperDelta, upperBorder)
-                # Delta pair is used as a key to look up hypotenuse
-                deltaPair = (lowerDelta, upperDelta)
-                distanceTable[deltaPair] = math.sqrt(lowerDelta ** 2 + upperDelta ** 2)
-        return distanceTable
-
     def doCellUpdate(self):
-        for i in range(self.width):
-            for j in range(self.height):
-                cellCurrSugar = self.grid[i][j].sugar
-                cellCurrSpice = self.grid[i][j].spice
-                cellMaxSugar = self.grid[i][j].maxSugar
-                cellMaxSpice = self.grid[i][j].maxSpice
-                cellSeason = self.grid[i][j].season
-                sugarRegrowth = min(cellCurrSugar + self.sugarRegrowRate, cellMaxSugar)
-                spiceRegrowth = min(cellCurrSpice + self.spiceRegrowRate, cellMaxSpice)
-                self.grid[i][j].timestep = self.timestep
-                if self.seasonInterval > 0:
-                    if self.timestep % self.seasonInterval == 0:
-                        self.grid[i][j].updateSeason()
-                    if (cellSeason == "wet") or (cellSeason == "dry" and self.seasonalGrowbackCountdown == self.seasonalGrowbackDelay):
+        # Array-backed grids update all cell resources with whole-array operations
+        if self.resourceGrid != None:
+            self.resourceGrid.doResourceUpdate()
+            self.wealthCreated, self.wealthTotal = self.resourceGrid.findEnvironmentWealth()
+        # Lazy cells apply their own regrowth when next accessed, so only cells still regrowing need updating to keep wealth totals current
+        elif self.growbackMode == "lazy":
+            for cell in list(self.growingCells):
+                cell.updateGrowback()
+        elif self.growbackMode == "eager":
+            wealthCreated = 0
+            wealthTotal = 0
+            for i in range(self.width):
+                for j in range(self.height):
+                    cellCurrSugar = self.grid[i][j].sugar
+                    cellCurrSpice = self.grid[i][j].spice
+                    cellMaxSugar = self.grid[i][j].maxSugar
+                    cellMaxSpice = self.grid[i][j].maxSpice
+                    cellSeason = self.grid[i][j].season
+                    sugarRegrowth = min(cellCurrSugar + self.sugarRegrowRate, cellMaxSugar)
+                    spiceRegrowth = min(cellCurrSpice + self.spiceRegrowRate, cellMaxSpice)
+                    self.grid[i][j].timestep = self.timestep
+                    if self.seasonInterval > 0:
+                        if self.timestep % self.seasonInterval == 0:
+                            self.grid[i][j].updateSeason()
+                        if (cellSeason == "wet") or (cellSeason == "dry" and self.seasonalGrowbackCountdown == self.seasonalGrowbackDelay):
+                            if self.grid[i][j].sugar + self.sugarRegrowRate != self.grid[i][j].sugar:
+                                self.grid[i][j].sugarLastProduced = self.sugarRegrowRate
+                            else:
+                                self.grid[i][j].sugarLastProduced = 0
+                            if self.grid[i][j].spice + self.spiceRegrowRate != self.grid[i][j].spice:
+                                self.grid[i][j].spiceLastProduced = self.spiceRegrowRate
+                            else:
+                                self.grid[i][j].spiceLastProduced = 0
+                            self.grid[i][j].sugar = sugarRegrowth
+                            self.grid[i][j].spice = spiceRegrowth
+                    else:
                         if self.grid[i][j].sugar + self.sugarRegrowRate != self.grid[i][j].sugar:
                             self.grid[i][j].sugarLastProduced = self.sugarRegrowRate
                         else:
@@ -83,24 +107,20 @@ class Environment:
                             self.grid[i][j].spiceLastProduced = 0
                         self.grid[i][j].sugar = sugarRegrowth
                         self.grid[i][j].spice = spiceRegrowth
-                else:
-                    if self.grid[i][j].sugar + self.sugarRegrowRate != self.grid[i][j].sugar:
-                        self.grid[i][j].sugarLastProduced = self.sugarRegrowRate
-                    else:
-                        self.grid[i][j].sugarLastProduced = 0
-                    if self.grid[i][j].spice + self.spiceRegrowRate != self.grid[i][j].spice:
-                        self.grid[i][j].spiceLastProduced = self.spiceRegrowRate
-                    else:
-                        self.grid[i][j].spiceLastProduced = 0
-                    self.grid[i][j].sugar = sugarRegrowth
-                    self.grid[i][j].spice = spiceRegrowth
+                    wealthCreated += self.grid[i][j].sugarLastProduced + self.grid[i][j].spiceLastProduced
+                    wealthTotal += self.grid[i][j].sugar + self.grid[i][j].spice
+            self.wealthCreated = wealthCreated
+            self.wealthTotal = wealthTotal
         if self.pollutionDiffusionStart <= self.timestep <= self.pollutionDiffusionEnd and self.pollutionDiffusionDelay > 0 and self.pollutionDiffusionCountdown == self.pollutionDiffusionDelay:
-            for i in range(self.height):
-                for j in range(self.width):
-                    self.grid[i][j].findPollutionFlux()
-            for i in range(self.height):
-                for j in range(self.width):
-                    self.grid[i][j].doPollutionDiffusion()
+            if self.resourceGrid != None:
+                self.resourceGrid.doPollutionDiffusion()
+            else:
+                for i in range(self.width):
+                    for j in range(self.height):
+                        self.grid[i][j].findPollutionFlux()
+                for i in range(self.width):
+                    for j in range(self.height):
+                        self.grid[i][j].doPollutionDiffusion()
 
     def doTimestep(self, timestep):
         self.timestep = timestep
@@ -108,18 +128,14 @@ class Environment:
         self.updatePollution()
         self.doCellUpdate()
 
-    def findCardinalCellRanges(self, maxDeltaX, maxDeltaY, cellCoords):
-        numCells = self.width * self.height
-        for i in range(numCells):
-            x1, y1 = cellCoords[i]
-            for j in range(x1 + 1, x1 + maxDeltaX + 1):
-                deltaX = self.findWraparoundDistance(j - x1, self.width)
-                self.grid[x1][y1].ranges[deltaX][self.grid[j % self.width][y1]] = deltaX
-                self.grid[j % self.width][y1].ranges[deltaX][self.grid[x1][y1]] = deltaX
-            for j in range(y1 + 1, y1 + maxDeltaY + 1):
-                deltaY = self.findWraparoundDistance(j - y1, self.height)
-                self.grid[x1][y1].ranges[deltaY][self.grid[x1][j % self.height]] = deltaY
-                self.grid[x1][j % self.height].ranges[deltaY][self.grid[x1][y1]] = deltaY
+    def findCardinalCellRanges(self, maxDeltaX, maxDeltaY):
+        # Cells reach partners ahead of them along each axis, and are reached by partners behind them, as when pairing cells in grid order
+        for deltaX in range(1, maxDeltaX + 1):
+            self.cellRanges[deltaX].extend([(deltaX, 0, deltaX, True, 0), (-1 * deltaX, 0, deltaX, False, 0)])
+        for deltaY in range(1, maxDeltaY + 1):
+            self.cellRanges[deltaY].extend([(0, deltaY, deltaY, True, 1), (0, -1 * deltaY, deltaY, False, 1)])
+        for gridRange in self.cellRanges:
+            self.cellRanges[gridRange].sort(key=lambda rangeOffset: self.findCellRangeOrder(0, 0, rangeOffset[0], rangeOffset[1], rangeOffset))
 
     def findCell(self, x, y):
         return self.grid[x][y]
@@ -128,6 +144,35 @@ class Environment:
         for i in range(self.width):
             for j in range(self.height):
                 self.grid[i][j].findNeighbors(self.neighborhoodMode)
+        if self.resourceGrid != None:
+            self.resourceGrid.findPollutionStencil()
+
+    def findCellRangeOrder(self, cellX, cellY, rangeX, rangeY, rangeOffset):
+        # Order cells in range as if ranges were built by pairing cells in grid order, first by the cell inserting the pair and then by axis
+        orderX, orderY = (cellX, cellY) if rangeOffset[3] == True else (rangeX, rangeY)
+        return (orderX * self.height + orderY) * 2 + rangeOffset[4]
+
+    def findCellRangeView(self, cell, cellRange):
+        cellsInRange = {}
+        for gridRange in range(1, cellRange + 1):
+            rangeCells = []
+            wrapped = False
+            for rangeOffset in self.cellRanges[gridRange]:
+                x = cell.x + rangeOffset[0]
+                y = cell.y + rangeOffset[1]
+                if x < 0 or x >= self.width or y < 0 or y >= self.height:
+                    if self.wraparound == False:
+                        continue
+                    x %= self.width
+                    y %= self.height
+                    wrapped = True
+                rangeCells.append((x, y, rangeOffset))
+            # Offsets are stored in grid order relative to the cell, which only changes when the range wraps around the grid
+            if wrapped == True:
+                rangeCells.sort(key=lambda rangeCell: self.findCellRangeOrder(cell.x, cell.y, rangeCell[0], rangeCell[1], rangeCell[2]))
+            for x, y, rangeOffset in rangeCells:
+                cellsInRange[self.grid[x][y]] = rangeOffset[2]
+        return cellsInRange
 
     def findCellRanges(self):
         config = self.sugarscape.configuration
@@ -144,39 +189,142 @@ class Environment:
             maxRadialDelta = min(maxAgentRange, math.floor(math.sqrt((self.width - 1) ** 2 + (self.height - 1) ** 2)))
         maxCardinalDelta = max(maxDeltaX, maxDeltaY)
         self.maxCellDistance = maxRadialDelta if config["agentVisionMode"] == "radial" and config["agentMovementMode"] == "radial" else maxCardinalDelta
-        cellCoords = [(x, y) for x in range(self.width) for y in range(self.height)]
         # Initialize ranges with all possible values
-        for x, y in cellCoords:
-            self.grid[x][y].ranges = {gridRange: {} for gridRange in range(1, self.maxCellDistance + 1)}
+        self.cellRanges = {gridRange: [] for gridRange in range(1, self.maxCellDistance + 1)}
 
         if config["agentVisionMode"] == "radial" and config["agentMovementMode"] == "radial":
-            self.findRadialCellRanges(maxDeltaX, maxDeltaY, maxRadialDelta, cellCoords)
+            self.findRadialCellRanges(maxDeltaX, maxDeltaY, maxRadialDelta)
         else:
-            self.findCardinalCellRanges(maxDeltaX, maxDeltaY, cellCoords)
-
-    def findRadialCellRanges(self, maxDeltaX, maxDeltaY, maxDeltaRadius, cellCoords):
-        distanceTable = self.createDistanceTable(maxDeltaX, maxDeltaY)
-        numCells = self.width * self.height
-        for i in range(numCells):
-            x1, y1 = cellCoords[i]
-            for j in range(i + 1, numCells):
-                x2, y2 = cellCoords[j]
-                deltaX = self.findWraparoundDistance(x1 - x2, self.width)
-                deltaY = self.findWraparoundDistance(y1 - y2, self.height)
-                if deltaX > maxDeltaX or deltaY > maxDeltaY:
+            self.findCardinalCellRanges(maxDeltaX, maxDeltaY)
+        self.cellRangeLookup = {}
+        self.cellRangeSizes = [0]
+        for gridRange, rangeOffsets in self.cellRanges.items():
+            for rangeOffset in rangeOffsets:
+                self.cellRangeLookup[(rangeOffset[0], rangeOffset[1])] = (gridRange, rangeOffset)
+            self.cellRangeSizes.append(self.cellRangeSizes[-1] + len(rangeOffsets))
+        self.cellRangeViews = {}
+        self.cellRangeViewSize = 0
+
+        # Bucket occupied cells so that a typical agent range only overlaps a few buckets
+        self.occupancyBucketSize = max(1, min(config["agentVision"][1], config["agentMovement"][1]))
+        bucketColumns = math.ceil(self.width / self.occupancyBucketSize)
+        bucketRows = math.ceil(self.height / self.occupancyBucketSize)
+        self.occupancyBucketSpans = {}
+        self.occupancyBuckets = [[set() for j in range(bucketRows)] for i in range(bucketColumns)]
+        self.occupiedCellCount = 0
+
+    def findCellsInRange(self, cell, cellRange):
+        # Cells in range only depend on the grid, so agents at the same cell with the same range share one read-only view
+        viewKey = (cell.x, cell.y, cellRange)
+        cellsInRange = self.cellRangeViews.get(viewKey)
+        if cellsInRange != None:
+            return cellsInRange
+        cellsInRange = self.findCellRangeView(cell, cellRange)
+        # Drop the oldest views once the views hold too many cells in total
+        while len(self.cellRangeViews) > 0 and self.cellRangeViewSize + len(cellsInRange) > self.cellRangeViewLimit:
+            oldestKey = next(iter(self.cellRangeViews))
+            self.cellRangeViewSize -= len(self.cellRangeViews.pop(oldestKey))
+        self.cellRangeViews[viewKey] = cellsInRange
+        self.cellRangeViewSize += len(cellsInRange)
+        return cellsInRange
+
+    def findOccupiedCellsInRange(self, cell, cellRange):
+        if cellRange <= 0:
+            return {}
+        bucketXs = self.findOccupancyBucketSpan(cell.x, cellRange, self.width)
+        bucketYs = self.findOccupancyBucketSpan(cell.y, cellRange, self.height)
+        # In crowded areas checking every cell in range is cheaper than placing every nearby agent within the range
+        bucketArea = len(bucketXs) * len(bucketYs) * self.occupancyBucketSize ** 2
+        crowded = self.occupiedCellCount * bucketArea * 3 > self.cellRangeSizes[cellRange] * self.width * self.height
+        if crowded == False:
+            occupancyBuckets = [self.occupancyBuckets[bucketX][bucketY] for bucketX in bucketXs for bucketY in bucketYs]
+            crowded = sum(len(occupancyBucket) for occupancyBucket in occupancyBuckets) * 3 > self.cellRangeSizes[cellRange]
+        if crowded == True:
+            return {rangeCell: distance for rangeCell, distance in self.findCellsInRange(cell, cellRange).items() if rangeCell.agent != None}
+        occupiedCells = []
+        for occupancyBucket in occupancyBuckets:
+            for occupiedCell in occupancyBucket:
+                deltaX = occupiedCell.x - cell.x
+                deltaY = occupiedCell.y - cell.y
+                if self.wraparound == True:
+                    deltaXs = [delta for delta in (deltaX % self.width, deltaX % self.width - self.width) if abs(delta) <= cellRange]
+                    deltaYs = [delta for delta in (deltaY % self.height, deltaY % self.height - self.height) if abs(delta) <= cellRange]
+                elif abs(deltaX) <= cellRange and abs(deltaY) <= cellRange:
+                    deltaXs = [deltaX]
+                    deltaYs = [deltaY]
+                else:
                     continue
-                deltaPair = tuple(sorted((deltaX, deltaY)))
-                distance = distanceTable[deltaPair]
-                gridRange = math.floor(distance)
-                if gridRange <= maxDeltaRadius:
-                    self.grid[x1][y1].ranges[gridRange][self.grid[x2][y2]] = distance
-                    self.grid[x2][y2].ranges[gridRange][self.grid[x1][y1]] = distance
-
-    def findWraparoundDistance(self, delta, border):
-        delta = abs(delta)
-        if self.sugarscape.configuration["environmentWraparound"] == True and delta > border / 2:
-            delta = border - delta
-        return delta
+                # Keep the earliest position the cell would take among the cells in range
+                rangeOrder = None
+                for deltaX in deltaXs:
+                    for deltaY in deltaYs:
+                        rangeEntry = self.cellRangeLookup.get((deltaX, deltaY))
+                        if rangeEntry == None or rangeEntry[0] > cellRange:
+                            continue
+                        gridRange, rangeOffset = rangeEntry
+                        order = (gridRange, self.findCellRangeOrder(cell.x, cell.y, occupiedCell.x, occupiedCell.y, rangeOffset))
+                        if rangeOrder == None or order < rangeOrder[0]:
+                            rangeOrder = (order, rangeOffset[2])
+                if rangeOrder != None:
+                    occupiedCells.append((rangeOrder[0], occupiedCell, rangeOrder[1]))
+        occupiedCells.sort(key=lambda occupied: occupied[0])
+        return {occupiedCell: distance for order, occupiedCell, distance in occupiedCells}
+
+    def findOccupancyBucketSpan(self, coordinate, cellRange, border):
+        bucketSpan = self.occupancyBucketSpans.get((coordinate, cellRange, border))
+        if bucketSpan == None:
+            if self.wraparound == True:
+                bucketSpan = sorted({(i % border) // self.occupancyBucketSize for i in range(coordinate - cellRange, coordinate + cellRange + 1)})
+            else:
+                bucketSpan = list(range(max(0, coordinate - cellRange) // self.occupancyBucketSize, min(border - 1, coordinate + cellRange) // self.occupancyBucketSize + 1))
+            self.occupancyBucketSpans[(coordinate, cellRange, border)] = bucketSpan
+        return bucketSpan
+
+    def findRadialCellRanges(self, maxDeltaX, maxDeltaY, maxDeltaRadius):
+        # Only enumerate offsets whose distance rounds down to at most the maximum radius
+        maxSquaredDistance = (maxDeltaRadius + 1) ** 2 - 1
+        maxDeltaX = min(maxDeltaX, maxDeltaRadius)
+        for deltaX in range(-1 * maxDeltaX, maxDeltaX + 1):
+            rowDeltaY = min(maxDeltaY, math.isqrt(maxSquaredDistance - deltaX ** 2))
+            for deltaY in range(-1 * rowDeltaY, rowDeltaY + 1):
+                if deltaX == 0 and deltaY == 0:
+                    continue
+                distance = math.sqrt(deltaX ** 2 + deltaY ** 2)
+                self.cellRanges[math.floor(distance)].append((deltaX, deltaY, distance, False, 0))
+
+    def findWealth(self):
+        self.maxWealthTotal = 0
+        self.wealthCreated = 0
+        self.wealthTotal = 0
+        # Running wealth totals only stay exact while every resource amount is a whole number
+        self.wealthExact = self.sugarRegrowRate % 1 == 0 and self.spiceRegrowRate % 1 == 0
+        for i in range(self.width):
+            for j in range(self.height):
+                cell = self.grid[i][j]
+                if cell.maxSugar % 1 != 0 or cell.maxSpice % 1 != 0 or cell.sugar % 1 != 0 or cell.spice % 1 != 0:
+                    self.wealthExact = False
+                self.maxWealthTotal += cell.maxSugar + cell.maxSpice
+                self.wealthCreated += cell.sugarLastProduced + cell.spiceLastProduced
+                self.wealthTotal += cell.sugar + cell.spice
+
+    def findWealthTotals(self, includeMaxResources=False):
+        if self.resourceGrid != None:
+            return self.resourceGrid.findEnvironmentWealth(includeMaxResources)
+        wealthCreated = 0
+        wealthTotal = 0
+        for i in range(self.width):
+            for j in range(self.height):
+                wealthCreated += self.grid[i][j].sugarLastProduced + self.grid[i][j].spiceLastProduced
+                wealthTotal += self.grid[i][j].sugar + self.grid[i][j].spice
+                if includeMaxResources == True:
+                    wealthCreated += self.grid[i][j].maxSugar + self.grid[i][j].maxSpice
+        return wealthCreated, wealthTotal
+
+    def isGrowbackTimestep(self, season, timestep):
+        if self.seasonInterval <= 0 or season == "wet":
+            return True
+        # Seasonal growback countdown resets to its delay on every multiple of the delay
+        return season == "dry" and self.seasonalGrowbackDelay > 0 and timestep % self.seasonalGrowbackDelay == 0
 
     def resetCell(self, x, y):
         self.grid[x][y] = None
@@ -189,6 +337,18 @@ class Environment:
                 cell.season = self.seasonSouth
             self.grid[x][y] = cell
 
+    def updateOccupiedCell(self, cell):
+        # Dummy cell lies outside the grid and is never in range of other cells
+        if cell == self.dummyCell:
+            return
+        occupancyBucket = self.occupancyBuckets[cell.x // self.occupancyBucketSize][cell.y // self.occupancyBucketSize]
+        self.occupiedCellCount -= len(occupancyBucket)
+        if cell.agent != None:
+            occupancyBucket.add(cell)
+        else:
+            occupancyBucket.discard(cell)
+        self.occupiedCellCount += len(occupancyBucket)
+
     def updatePollution(self):
         if self.pollutionDiffusionStart <= self.timestep <= self.pollutionDiffusionEnd and self.pollutionDiffusionDelay > 0:
             self.pollutionDiffusionCountdown -= 1
@@ -1,6 +1,6 @@
 import agent
 
-import copy
+import functools
 import math
 import random
 import sys
@@ -110,8 +110,9 @@ class Bentham(agent.Agent):
         if "all" in self.debug or "agent" in self.debug:
             self.printCellScores(cells)
 
+        neighborTerms = self.findEthicalNeighborTerms()
         for cell in cells:
-            cell["wealth"] = self.findEthicalValueOfCell(cell["cell"])
+            cell["wealth"] = self.findEthicalValueOfCell(cell["cell"], neighborTerms)
         if self.selfishnessFactor >= 0:
             for cell in cells:
                 if cell["wealth"] > 0:
@@ -138,7 +139,69 @@ class Bentham(agent.Agent):
                 print(f"Agent {self.ID} could not find an ethical cell")
         return bestCell
 
-    def findEthicalValueOfCell(self, cell):
+    def findEthicalNeighborTerms(self):
+        # Terms depending only on the neighbor are the same for every cell considered in a single decision
+        environment = self.cell.environment
+        globalMaxWealth = environment.globalMaxSugar + environment.globalMaxSpice
+        neighborhoodSize = len(self.neighborhood)
+        tribe = self.findTribe() if self.decisionModelTribalFactor >= 0 else None
+        neighborTerms = []
+        for neighbor in self.neighborhood:
+            if neighbor.isAlive() == False:
+                continue
+            neighborMetabolism = neighbor.sugarMetabolism + neighbor.spiceMetabolism
+            # Agent discount implements Bentham's purity and fecundity
+            discount = neighbor.decisionModelLookaheadDiscount if neighbor.decisionModelLookaheadFactor != 0 else 0
+            cellsInRange = len(neighbor.cellsInRange)
+            # Group biases scale the value of a cell to a neighbor in this order
+            groupFactors = []
+            if self.decisionModelAgeismFactor >= 0:
+                neighborAge = neighbor.age
+                inRelativeAgeWindow = abs(neighborAge - self.age) <= environment.inGroupAgeRelativeRange
+                inAbsoluteAgeRange = False
+                for minAge, maxAge in environment.inGroupAgeAbsoluteRanges:
+                    if neighborAge >= minAge and (neighborAge <= maxAge or maxAge == -1):
+                        inAbsoluteAgeRange = True
+                        break
+                # Neighbor is considered in-group for age if within relative or absolute age range
+                if inRelativeAgeWindow or inAbsoluteAgeRange:
+                    groupFactors.append(self.decisionModelAgeismFactor)
+                else:
+                    groupFactors.append(1 - self.decisionModelAgeismFactor)
+            if self.decisionModelRacismFactor >= 0:
+                neighborRace = neighbor.findRace()
+                if neighborRace == self.race or neighborRace in environment.inGroupRaces:
+                    # If same race or in-group race, multiply by racism factor
+                    groupFactors.append(self.decisionModelRacismFactor)
+                else:
+                    # If different race and not in-group, multiply by inverse racism factor
+                    groupFactors.append(1 - self.decisionModelRacismFactor)
+            if self.sex in environment.sexistGroups and self.decisionModelSexismFactor >= 0:
+                if neighbor.sex == self.sex:
+                    # If same sex, multiply by sexism factor
+                    groupFactors.append(self.decisionModelSexismFactor)
+                else:
+                    # If different sex, multiply by inverse sexism factor
+                    groupFactors.append(1 - self.decisionModelSexismFactor)
+            if self.decisionModelTribalFactor >= 0:
+                if neighbor.findTribe() == tribe:
+                    groupFactors.append(self.decisionModelTribalFactor)
+                else:
+                    groupFactors.append(1 - self.decisionModelTribalFactor)
+            if self.selfishnessFactor >= 0:
+                if neighbor == self:
+                    groupFactors.append(self.selfishnessFactor)
+                else:
+                    groupFactors.append(1 - self.selfishnessFactor)
+            # Time to live intensity is only found once the neighbor can reach a cell
+            neighborTerms.append({"cell": neighbor.cell, "cellsInRange": neighbor.cellsInRange, "discount": discount, "extent": neighborhoodSize / cellsInRange if cellsInRange > 0 else 1,
+                                  "futureIntensityScale": globalMaxWealth * len(neighbor.cell.neighbors), "groupFactors": groupFactors, "intensity": None, "metabolism": neighborMetabolism,
+                                  "neighbor": neighbor, "opportunityCost": neighbor != self and self.selfishnessFactor < 1, "rangeSize": cellsInRange})
+        return neighborTerms
+
+    def findEthicalValueOfCell(self, cell, neighborTerms=None):
+        if neighborTerms == None:
+            neighborTerms = self.findEthicalNeighborTerms()
         happiness = 0
         unhappiness = 0
         cellSiteWealth = cell.sugar + cell.spice
@@ -150,89 +213,47 @@ class Bentham(agent.Agent):
             cellSiteWealth += min(agentWealth, globalMaxCombatLoot)
             cellMaxSiteWealth += min(agentWealth, globalMaxCombatLoot)
         cellNeighborWealth = cell.findNeighborWealth()
-        globalMaxWealth = cell.environment.globalMaxSugar + cell.environment.globalMaxSpice
+        cellPollution = 1 + cell.pollution
         cellValue = 0
-        neighborhoodSize = len(self.neighborhood)
         futureNeighborhoodSize = len(self.findNeighborhood(cell)) if self.decisionModelLookaheadFactor != 0 else 1
-        for neighbor in self.neighborhood:
-            if neighbor.isAlive() == False:
-                continue
-            certainty = 1 if neighbor.canReachCell(cell) == True else 0
+        # Timesteps to reach cell, currently 1 since agents only plan for the current timestep
+        timestepDistance = 1
+        proximity = 1 / timestepDistance
+        for terms in neighborTerms:
             # Skip if agent cannot reach cell
-            if certainty == 0:
+            if cell != terms["cell"] and cell not in terms["cellsInRange"]:
                 continue
-            # Timesteps to reach cell, currently 1 since agents only plan for the current timestep
-            timestepDistance = 1
-            neighborMetabolism = neighbor.sugarMetabolism + neighbor.spiceMetabolism
+            certainty = 1
+            neighborMetabolism = terms["metabolism"]
+            if terms["intensity"] == None:
+                terms["intensity"] = 1 / (1 + terms["neighbor"].findTimeToLive())
             # If agent does not have metabolism, set duration to seemingly infinite
             cellDuration = cellSiteWealth / neighborMetabolism if neighborMetabolism > 0 else 0
-            proximity = 1 / timestepDistance
-            intensity = (1 / (1 + neighbor.findTimeToLive()) / (1 + cell.pollution))
+            intensity = terms["intensity"] / cellPollution
             duration = cellDuration / cellMaxSiteWealth if cellMaxSiteWealth > 0 else 0
-            # Agent discount, futureDuration, and futureIntensity implement Bentham's purity and fecundity
-            discount = neighbor.decisionModelLookaheadDiscount if neighbor.decisionModelLookaheadFactor != 0 else 0
+            # Agent futureDuration and futureIntensity implement Bentham's purity and fecundity
             futureDuration = (cellSiteWealth - neighborMetabolism) / neighborMetabolism if neighborMetabolism > 0 else cellSiteWealth
             futureDuration = futureDuration / cellMaxSiteWealth if cellMaxSiteWealth > 0 else 0
             # Normalize future intensity by number of adjacent cells
-            cellNeighbors = len(neighbor.cell.neighbors)
-            futureIntensity = cellNeighborWealth / (globalMaxWealth * cellNeighbors)
+            futureIntensity = cellNeighborWealth / terms["futureIntensityScale"]
             # Normalize extent by total cells in range
-            cellsInRange = len(neighbor.cellsInRange)
-            extent = neighborhoodSize / cellsInRange if cellsInRange > 0 else 1
+            cellsInRange = terms["rangeSize"]
             futureExtent = futureNeighborhoodSize / cellsInRange if cellsInRange > 0 and self.decisionModelLookaheadFactor != 0 else 1
-            neighborCellValue = 0
 
-            currentReward = extent * (intensity + duration)
+            currentReward = terms["extent"] * (intensity + duration)
             futureReward = futureExtent * (futureIntensity + futureDuration)
-            neighborCellValue = (certainty * proximity) * (currentReward + (discount * futureReward))
+            neighborCellValue = (certainty * proximity) * (currentReward + (terms["discount"] * futureReward))
 
             # If not the agent moving, consider these as opportunity costs
-            if neighbor != self and self.selfishnessFactor < 1:
+            if terms["opportunityCost"] == True:
                 neighborCellValue = -1 * neighborCellValue
                 # If move will kill this neighbor and penalty is too slight, make it more severe
-                if cell == neighbor.cell and neighborCellValue > -1:
+                if cell == terms["cell"] and neighborCellValue > -1:
                     neighborCellValue = -1
 
-            if self.decisionModelAgeismFactor >= 0:
-                neighborAge = neighbor.age
-                inRelativeAgeWindow = abs(neighborAge - self.age) <= self.cell.environment.inGroupAgeRelativeRange
-                inAbsoluteAgeRange = False
-                for minAge, maxAge in self.cell.environment.inGroupAgeAbsoluteRanges:
-                    if neighborAge >= minAge and (neighborAge <= maxAge or maxAge == -1):
-                        inAbsoluteAgeRange = True
-                        break
-                # Neighbor is considered in-group for age if within relative or absolute age range
-                if inRelativeAgeWindow or inAbsoluteAgeRange:
-                    neighborCellValue *= self.decisionModelAgeismFactor
-                else:
-                    neighborCellValue *= 1 - self.decisionModelAgeismFactor
-            
-            if self.decisionModelRacismFactor >= 0:
-                neighborRace = neighbor.findRace()
-                if neighborRace == self.race or neighborRace in self.cell.environment.inGroupRaces:
-                    # If same race or in-group race, multiply by racism factor
-                    neighborCellValue *= self.decisionModelRacismFactor
-                else:
-                    # If different race and not in-group, multiply by inverse racism factor
-                    neighborCellValue *= 1 - self.decisionModelRacismFactor
-            if self.sex in self.cell.environment.sexistGroups and self.decisionModelSexismFactor >= 0:
-                if neighbor.sex == self.sex:
-                    # If same sex, multiply by sexism factor
-                    neighborCellValue *= self.decisionModelSexismFactor
-                else:
-                    # If different sex, multiply by inverse sexism factor
-                    neighborCellValue *= 1 - self.decisionModelSexismFactor
-            if self.decisionModelTribalFactor >= 0:
-                if neighbor.findTribe() == self.findTribe():
-                    neighborCellValue *= self.decisionModelTribalFactor
-                else:
-                    neighborCellValue *= 1 - self.decisionModelTribalFactor
-            if self.selfishnessFactor >= 0:
-                if neighbor == self:
-                    neighborCellValue *= self.selfishnessFactor
-                else:
-                    neighborCellValue *= 1 - self.selfishnessFactor
-            else:
+            for groupFactor in terms["groupFactors"]:
+                neighborCellValue *= groupFactor
+            if self.selfishnessFactor < 0:
                 if neighborCellValue > 0:
                     happiness += neighborCellValue
                 else:
@@ -291,67 +312,26 @@ class Leader(agent.Agent):
         self.resetForTimestep()
         defaultRecursionLimit = sys.getrecursionlimit()
         sys.setrecursionlimit(self.recursionLimit)
-        agents = [agent for agent in copy.deepcopy(self.cell.environment.sugarscape.agents) if agent.isAlive() == True]
+        sugarscape = self.cell.environment.sugarscape
+        agents = [agent for agent in sugarscape.agents if agent.isAlive() == True]
 
-        # Use a list of counters to iterate through the search space one possible placement at a time
+        # Each placement holds the index into the cells in range of every agent
         cellRanges = []
-        counters = []
         for agent in agents:
             cellsInRange = list(agent.cellsInRange.keys()) if len(agent.cellsInRange) > 0 else [agent.cell]
-            cellRanges.append(len(cellsInRange) - 1)
-            counters.append(0)
-
-        attempts = 0
-        maxAttempts = sys.maxsize
-        bestPlacement = {}
-        bestScore = (-1 * sys.maxsize) - 1
+            cellRanges.append(len(cellsInRange))
 
+        budget = sugarscape.agentLeaderSearchBudget if sugarscape.agentLeaderSearchBudget != -1 else sys.maxsize
         # Ensure each simulated timestep uses the same random numbers
         randomNumberReset = random.getstate()
-        searchSpaceExhausted = False
-        while attempts < maxAttempts and searchSpaceExhausted == False:
-            possiblePlacement = {"placement": {}, "score": 0}
-            futurescape = copy.deepcopy(self.cell.environment.sugarscape)
-            random.setstate(randomNumberReset)
-
-            counterIndex = -1
-            for agent in agents:
-                # If agent is not in the copied environment, skip its consideration
-                agent = next(a for a in futurescape.agents if a.ID == agent.ID)
-                if agent == None:
-                    continue
-                counterIndex += 1
-                if agent.isAlive() == False:
-                    continue
-                agentPremoveIndex = counters[counterIndex]
-                cellsInRange = list(agent.cellsInRange.keys()) if len(agent.cellsInRange) > 0 else [agent.cell]
-                premove = cellsInRange[agentPremoveIndex]
-                agent.doTimestep(futurescape.timestep, premove)
-                currCell = agent.cell
-                if currCell == None:
-                    continue
-                possiblePlacement["placement"][agent.ID] = self.cell.environment.findCell(agent.cell.x, agent.cell.y)
-            futurescape.updateRuntimeStats()
-            possiblePlacement["score"] = futurescape.runtimeStats["meanHappiness"]
-            if possiblePlacement["score"] > bestScore:
-                bestScore = possiblePlacement["score"]
-                bestPlacement = possiblePlacement["placement"]
-
-            #Update counter indices
-            carry = 1
-            for i in range(-1, -1 * (len(counters) + 1), -1):
-                if carry > 0:
-                    counters[i] += carry
-                    carry = 0
-                if counters[i] > cellRanges[i]:
-                    counters[i] = 0
-                    carry = 1
-            # If there is a carry out on the last counter, all placements in the search space have been considered
-            if carry == 1 and counters[0] == 0:
-                searchSpaceExhausted = True
-            attempts += 1
-
-        self.agentPlacements = bestPlacement
+        if sugarscape.agentLeaderSearch == "greedy":
+            bestOutcome = self.findGreedyPlacement(agents, cellRanges, budget, randomNumberReset)
+        elif sugarscape.agentLeaderSearch == "sampled":
+            bestOutcome = self.findSampledPlacement(agents, cellRanges, budget, randomNumberReset)
+        else:
+            bestOutcome = self.findExhaustivePlacement(agents, cellRanges, budget, randomNumberReset)
+
+        self.agentPlacements = {agentID: self.cell.environment.findCell(x, y) for agentID, (x, y) in bestOutcome["placement"].items()}
         random.setstate(randomNumberReset)
         sys.setrecursionlimit(defaultRecursionLimit)
 
@@ -363,6 +343,128 @@ class Leader(agent.Agent):
             return agent.cell
         return self.agentPlacements[agent.ID]
 
+    def findBestPlacementOutcome(self, outcomes, bestOutcome=None):
+        if bestOutcome == None:
+            bestOutcome = {"placement": {}, "score": (-1 * sys.maxsize) - 1}
+        # Keep the first of equally scored placements so results do not depend on how many are simulated at once
+        for outcome in outcomes:
+            if outcome["score"] > bestOutcome["score"]:
+                bestOutcome = outcome
+        return bestOutcome
+
+    def findExhaustivePlacement(self, agents, cellRanges, budget, randomNumberReset):
+        bestOutcome = self.findBestPlacementOutcome([])
+        processes = self.cell.environment.sugarscape.agentLeaderSearchProcesses
+        # Use a list of counters to iterate through the search space one possible placement at a time
+        counters = [0 for agent in agents]
+        attempts = 0
+        searchSpaceExhausted = False
+        while attempts < budget and searchSpaceExhausted == False:
+            placements = []
+            while len(placements) < min(processes, budget - attempts) and searchSpaceExhausted == False:
+                placements.append(counters[:])
+                #Update counter indices
+                carry = 1
+                for i in range(-1, -1 * (len(counters) + 1), -1):
+                    if carry > 0:
+                        counters[i] += carry
+                        carry = 0
+                    if counters[i] >= cellRanges[i]:
+                        counters[i] = 0
+                        carry = 1
+                # If there is a carry out on the last counter, all placements in the search space have been considered
+                if carry == 1:
+                    searchSpaceExhausted = True
+            bestOutcome = self.findBestPlacementOutcome(self.findPlacementOutcomes(agents, placements, randomNumberReset), bestOutcome)
+            attempts += len(placements)
+        return bestOutcome
+
+    def findGreedyPlacement(self, agents, cellRanges, budget, randomNumberReset):
+        # Start from the cell each agent would choose for itself, then repair one agent at a time while mean happiness improves
+        sugarscape = self.cell.environment.sugarscape
+        bestPlacement = sugarscape.findSnapshotOutcome(functools.partial(self.findGreedyPlacementSeed, agents=agents, randomNumberReset=randomNumberReset))
+        bestOutcome = self.findPlacementOutcomes(agents, [bestPlacement], randomNumberReset)[0]
+        # Simulating the starting placement counts against the budget like any other placement
+        attempts = 1
+        improved = True
+        while improved == True and attempts < budget:
+            improved = False
+            for i in range(len(agents)):
+                placements = []
+                for cellIndex in range(cellRanges[i]):
+                    if cellIndex != bestPlacement[i]:
+                        placement = bestPlacement[:]
+                        placement[i] = cellIndex
+                        placements.append(placement)
+                placements = placements[:budget - attempts]
+                outcomes = self.findPlacementOutcomes(agents, placements, randomNumberReset)
+                attempts += len(placements)
+                for j in range(len(outcomes)):
+                    if outcomes[j]["score"] > bestOutcome["score"]:
+                        bestPlacement = placements[j]
+                        bestOutcome = outcomes[j]
+                        improved = True
+                if attempts >= budget:
+                    break
+        return bestOutcome
+
+    def findGreedyPlacementSeed(self, futurescape, agents, randomNumberReset):
+        random.setstate(randomNumberReset)
+        placement = []
+        for agent in agents:
+            # Leader agent does not move
+            if agent == self:
+                placement.append(0)
+                continue
+            cellsInRange = list(agent.cellsInRange.keys()) if len(agent.cellsInRange) > 0 else [agent.cell]
+            greedyBestCell = agent.rankCellsInRange()[0]["cell"]
+            placement.append(cellsInRange.index(greedyBestCell) if greedyBestCell in cellsInRange else 0)
+        return placement
+
+    def findPlacementOutcome(self, futurescape, agents, placement, randomNumberReset):
+        possiblePlacement = {"placement": {}, "score": 0}
+        random.setstate(randomNumberReset)
+        counterIndex = -1
+        for agent in agents:
+            # If agent is not in the copied environment, skip its consideration
+            agent = next(a for a in futurescape.agents if a.ID == agent.ID)
+            if agent == None:
+                continue
+            counterIndex += 1
+            if agent.isAlive() == False:
+                continue
+            agentPremoveIndex = placement[counterIndex]
+            cellsInRange = list(agent.cellsInRange.keys()) if len(agent.cellsInRange) > 0 else [agent.cell]
+            premove = cellsInRange[agentPremoveIndex]
+            agent.doTimestep(futurescape.timestep, premove)
+            currCell = agent.cell
+            if currCell == None:
+                continue
+            possiblePlacement["placement"][agent.ID] = (agent.cell.x, agent.cell.y)
+        if futurescape.agentTimestepMode == "phased":
+            futurescape.doAgentUpkeep()
+        futurescape.updateRuntimeStats()
+        possiblePlacement["score"] = futurescape.runtimeStats["meanHappiness"]
+        return possiblePlacement
+
+    def findPlacementOutcomes(self, agents, placements, randomNumberReset):
+        # Each simulated timestep runs on its own snapshot of the simulation
+        sugarscape = self.cell.environment.sugarscape
+        simulations = [functools.partial(self.findPlacementOutcome, agents=agents, placement=placement, randomNumberReset=randomNumberReset) for placement in placements]
+        return sugarscape.findSnapshotOutcomes(simulations, sugarscape.agentLeaderSearchProcesses)
+
+    def findSampledPlacement(self, agents, cellRanges, budget, randomNumberReset):
+        # Without a budget, sample as many placements as a single greedy pass would simulate
+        if budget == sys.maxsize:
+            budget = 1 + sum(cellRange - 1 for cellRange in cellRanges)
+        # Draw placements from a separate generator so sampling leaves the simulated random numbers unchanged
+        sampler = random.Random()
+        sampler.setstate(randomNumberReset)
+        placements = [[0 for agent in agents]]
+        while len(placements) < budget:
+            placements.append([sampler.randrange(cellRange) for cellRange in cellRanges])
+        return self.findBestPlacementOutcome(self.findPlacementOutcomes(agents, placements, randomNumberReset))
+
     def findUrgencyForAgent(self, agent):
         diseased = 0 if agent.isSick() else 1
         happiness = agent.findHappiness()
@@ -418,10 +520,10 @@ class Temperance(agent.Agent):
 
         for cell in cells:
             cell["wealth"] = self.findEthicalValueOfCell(cell["cell"])
-        cells = self.sortCellsByWealth(cells)
         if self.pecs == True:
-            bestCell = cells[0]["cell"]
+            bestCell = self.findBestCellByWealth(cells)["cell"]
         else:
+            cells = self.sortCellsByWealth(cells)
             bestCell = self.findSimpleTemperanceBestEthicalCell(cells)
 
         if bestCell == None:
@@ -433,8 +535,7 @@ class Temperance(agent.Agent):
                 print(f"Agent {self.ID} could not find an ethical cell")
         return bestCell
 
-    def findCellCognitiveScore(self, cell):
-        deltaTimeToLive = self.findTimeToLive(potentialCell=cell) - self.timeToLive
+    def findCellCognitiveScore(self, deltaTimeToLive):
         score = 0
         if deltaTimeToLive < 1:
             return -1
@@ -450,8 +551,7 @@ class Temperance(agent.Agent):
                 score -= self.rules["communityDisdainOfExtremeOverconsumption"]
         return math.erf(score)
 
-    def findCellEmotionalScore(self, cell):
-        deltaTimeToLive = self.findTimeToLive(potentialCell=cell) - self.timeToLive
+    def findCellEmotionalScore(self, deltaTimeToLive):
         score = 0
         if deltaTimeToLive > 1:
             score = score - self.timesOverharvested
@@ -461,11 +561,10 @@ class Temperance(agent.Agent):
     def findCellPhysicalScore(self):
         return math.erf(1 / self.timeToLive) if self.timeToLive > 0 else 1
 
-    def findCellSimpleScore(self, cell):
-        return abs(self.findTimeToLive(potentialCell=cell) - self.timeToLive)
+    def findCellSimpleScore(self, deltaTimeToLive):
+        return abs(deltaTimeToLive)
 
-    def findCellSocialScore(self, cell):
-        deltaTimeToLive = self.findTimeToLive(potentialCell=cell) - self.timeToLive
+    def findCellSocialScore(self, deltaTimeToLive):
         score = 0
         if deltaTimeToLive <= 1:
             score = 1
@@ -477,14 +576,16 @@ class Temperance(agent.Agent):
         return math.erf(score)
 
     def findEthicalValueOfCell(self, cell):
-        score = self.findCellSimpleScore(cell)
+        # Every score uses the same projected change in time to live from moving to the cell
+        deltaTimeToLive = self.findTimeToLive(potentialCell=cell) - self.timeToLive
+        score = self.findCellSimpleScore(deltaTimeToLive)
         if self.pecs == True:
             if self.totalMetabolism == 0:
                 return 0
             physicalScore = self.findCellPhysicalScore()
-            emotionalScore = self.findCellEmotionalScore(cell)
-            cognitiveScore = self.findCellCognitiveScore(cell)
-            socialScore = self.findCellSocialScore(cell)
+            emotionalScore = self.findCellEmotionalScore(deltaTimeToLive)
+            cognitiveScore = self.findCellCognitiveScore(deltaTimeToLive)
+            socialScore = self.findCellSocialScore(deltaTimeToLive)
             score = physicalScore + emotionalScore + cognitiveScore + socialScore
             # TODO: Improve fidelity to temperance as it relates to agent lives
             #print(f"Agent {self.ID} -> ({cell.x},{cell.y}): {score} = {physicalScore} + {emotionalScore} + {cognitiveScore} + {socialScore}")
@@ -0,0 +1,111 @@
+import cell
+
+import numpy
+
+# Arrays hold Python numbers (object dtype) so results match the cell-based grid exactly
+class ResourceGrid:
+    def __init__(self, environment):
+        self.environment = environment
+        shape = (environment.width, environment.height)
+        self.maxSpice = numpy.zeros(shape, dtype=object)
+        self.maxSugar = numpy.zeros(shape, dtype=object)
+        self.neighborCounts = numpy.zeros(shape, dtype=object)
+        self.pollution = numpy.zeros(shape, dtype=object)
+        self.pollutionStencil = []
+        self.season = numpy.full(shape, None, dtype=object)
+        self.spice = numpy.zeros(shape, dtype=object)
+        self.spiceLastProduced = numpy.zeros(shape, dtype=object)
+        self.sugar = numpy.zeros(shape, dtype=object)
+        self.sugarLastProduced = numpy.zeros(shape, dtype=object)
+        self.timestep = numpy.zeros(shape, dtype=object)
+
+    def doPollutionDiffusion(self):
+        # Add neighbor pollution in the same order as each cell's neighbors to match the cell-based mean exactly
+        pollutionFlux = numpy.zeros(self.pollution.shape, dtype=object)
+        for cellsX, cellsY, neighborsX, neighborsY in self.pollutionStencil:
+            pollutionFlux[cellsX, cellsY] += self.pollution[neighborsX, neighborsY]
+        self.pollution = pollutionFlux / self.neighborCounts
+
+    def doResourceUpdate(self):
+        environment = self.environment
+        sugarRegrowRate = environment.sugarRegrowRate
+        spiceRegrowRate = environment.spiceRegrowRate
+        sugarRegrowth = numpy.minimum(self.sugar + sugarRegrowRate, self.maxSugar)
+        spiceRegrowth = numpy.minimum(self.spice + spiceRegrowRate, self.maxSpice)
+        sugarProduced = self.findLastProduced(self.sugar, sugarRegrowRate)
+        spiceProduced = self.findLastProduced(self.spice, spiceRegrowRate)
+        self.timestep.fill(environment.timestep)
+        if environment.seasonInterval > 0:
+            wetCells = self.season == "wet"
+            growingCells = wetCells.copy()
+            if environment.seasonalGrowbackCountdown == environment.seasonalGrowbackDelay:
+                growingCells |= self.season == "dry"
+            if environment.timestep % environment.seasonInterval == 0:
+                self.season[wetCells] = "dry"
+                self.season[~wetCells] = "wet"
+            self.sugarLastProduced[growingCells] = sugarProduced[growingCells]
+            self.spiceLastProduced[growingCells] = spiceProduced[growingCells]
+            self.sugar[growingCells] = sugarRegrowth[growingCells]
+            self.spice[growingCells] = spiceRegrowth[growingCells]
+        else:
+            self.sugarLastProduced = sugarProduced
+            self.spiceLastProduced = spiceProduced
+            self.sugar = sugarRegrowth
+            self.spice = spiceRegrowth
+
+    def findEnvironmentWealth(self, includeMaxResources=False):
+        # Sum cell by cell in grid order to match the totals of the cell-based grid
+        wealthCreated = self.sugarLastProduced + self.spiceLastProduced
+        if includeMaxResources == True:
+            wealthCreated = numpy.stack((wealthCreated, self.maxSugar + self.maxSpice), axis=-1)
+        wealthTotal = self.sugar + self.spice
+        return wealthCreated.sum(), wealthTotal.sum()
+
+    def findLastProduced(self, resource, regrowRate):
+        lastProduced = numpy.zeros(resource.shape, dtype=object)
+        lastProduced[resource + regrowRate != resource] = regrowRate
+        return lastProduced
+
+    def findPollutionStencil(self):
+        environment = self.environment
+        # Each stencil layer pairs every cell having an nth neighbor with the coordinates of that neighbor
+        stencilLayers = []
+        for i in range(environment.width):
+            for j in range(environment.height):
+                neighbors = environment.grid[i][j].neighbors
+                self.neighborCounts[i, j] = len(neighbors)
+                for n in range(len(neighbors)):
+                    if n == len(stencilLayers):
+                        stencilLayers.append(([], [], [], []))
+                    stencilLayers[n][0].append(i)
+                    stencilLayers[n][1].append(j)
+                    stencilLayers[n][2].append(neighbors[n].x)
+                    stencilLayers[n][3].append(neighbors[n].y)
+        self.pollutionStencil = [tuple(numpy.array(coordinates, dtype=int) for coordinates in layer) for layer in stencilLayers]
+
+def gridProperty(name):
+    def getValue(self):
+        return getattr(self.environment.resourceGrid, name)[self.gridIndex]
+
+    def setValue(self, value):
+        getattr(self.environment.resourceGrid, name)[self.gridIndex] = value
+
+    return property(getValue, setValue)
+
+# Cell whose resource state is a view into the environment resource grid arrays
+class GridCell(cell.Cell):
+    __slots__ = ["gridIndex"]
+
+    def __init__(self, x, y, environment, maxSugar=0, maxSpice=0, growbackRate=0):
+        self.gridIndex = (x, y)
+        super().__init__(x, y, environment, maxSugar, maxSpice, growbackRate)
+
+    maxSpice = gridProperty("maxSpice")
+    maxSugar = gridProperty("maxSugar")
+    pollution = gridProperty("pollution")
+    season = gridProperty("season")
+    spice = gridProperty("spice")
+    spiceLastProduced = gridProperty("spiceLastProduced")
+    sugar = gridProperty("sugar")
+    sugarLastProduced = gridProperty("sugarLastProduced")
+    timestep = gridProperty("timestep")
@@ -537,7 +537,7 @@ class GUI:
         elif self.activeNetwork.get() == "Loans":
             for agent in self.sugarscape.agents:
                 # Loan records are always kept on both sides, so only one side is needed
-                for loanRecord in agent.socialNetwork["creditors"]:
+                for loanRecord in agent.socialNetwork["creditors"].values():
                     creditor = loanRecord["creditor"]
                     if creditor.isAlive() == True:
                         lineEndpointsPair = frozenset([(agent.cell.x, agent.cell.y), (creditor.cell.x, creditor.cell.y)])
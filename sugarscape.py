@@ -6,15 +6,23 @@ import condition
 import environment
 import ethics
 
+import bisect
 import copy
 import getopt
 import hashlib
 import json
 import math
+import multiprocessing
+import os
+import pickle
 import random
 import re
 import sys
 
+# Simulation read by forked processes planning agent moves and the agent states it held when forked
+movePlanningAgentStates = []
+movePlanningSugarscape = None
+
 class Sugarscape:
     def __init__(self, configuration):
         self.agentConfigHashes = None
@@ -27,6 +35,7 @@ class Sugarscape:
         environmentConfiguration = {"equator": configuration["environmentEquator"],
                                     "globalMaxSpice": configuration["environmentMaxSpice"],
                                     "globalMaxSugar": configuration["environmentMaxSugar"],
+                                    "growbackMode": configuration["environmentGrowbackMode"],
                                     "ageistAbsoluteRanges": configuration["environmentAgeistAbsoluteRanges"],
                                     "ageistRelativeRange": configuration["environmentAgeistRelativeRange"],
                                     "inGroupRaces": configuration["environmentInGroupRaces"],
@@ -58,6 +67,12 @@ class Sugarscape:
         self.agentEndowmentIndex = 0
         self.agentEndowments = []
         self.agentLeader = None
+        self.agentLeaderSearch = configuration["agentLeaderSearch"]
+        self.agentLeaderSearchBudget = configuration["agentLeaderSearchBudget"]
+        self.agentLeaderSearchProcesses = configuration["agentLeaderSearchProcesses"]
+        self.agentMovementProcesses = configuration["agentMovementProcesses"]
+        self.agentTimestepMode = configuration["agentTimestepMode"]
+        self.agentTradeMode = configuration["agentTradeMode"]
         self.agents = []
         self.bornAgents = []
         self.deadAgents = []
@@ -212,7 +227,7 @@ class Sugarscape:
                 a = ethics.Leader(agentID, self.timestep, placementCell, agentConfiguration)
                 a.gotoCell(self.environment.dummyCell)
                 self.agentLeader = a
-                self.environment.dummyCell.agent = a
+                self.environment.dummyCell.setAgent(a)
                 a.findCellsInRange()
                 continue
 
@@ -257,7 +272,7 @@ class Sugarscape:
                 tags = self.generateTribeTags(tribe)
                 a.tags = tags
                 a.tribe = a.findTribe()
-            placementCell.agent = a
+            placementCell.setAgent(a)
             self.agents.append(a)
             if self.timestep > 0:
                 self.replacedAgents.append(a)
@@ -269,14 +284,26 @@ class Sugarscape:
     def configureCell(self, cell, mode, delta):
         if cell == None or delta == 0:
             return
+        # Keep the running environment wealth totals in step with the edited cell
         if mode == "currentSpice":
-            cell.spice = min(max(0, (cell.spice + delta)), self.environment.globalMaxSpice)
+            spice = cell.spice
+            cell.spice = min(max(0, (spice + delta)), self.environment.globalMaxSpice)
+            self.environment.wealthTotal += cell.spice - spice
         elif mode == "currentSugar":
-            cell.sugar = min(max(0, (cell.sugar + delta)), self.environment.globalMaxSugar)
+            sugar = cell.sugar
+            cell.sugar = min(max(0, (sugar + delta)), self.environment.globalMaxSugar)
+            self.environment.wealthTotal += cell.sugar - sugar
         elif mode == "maximumSpice":
-            cell.maxSpice = min(max(0, (cell.maxSpice + delta)), self.environment.globalMaxSpice)
+            maxSpice = cell.maxSpice
+            cell.maxSpice = min(max(0, (maxSpice + delta)), self.environment.globalMaxSpice)
+            self.environment.maxWealthTotal += cell.maxSpice - maxSpice
         elif mode == "maximumSugar":
-            cell.maxSugar = min(max(0, (cell.maxSugar + delta)), self.environment.globalMaxSugar)
+            maxSugar = cell.maxSugar
+            cell.maxSugar = min(max(0, (maxSugar + delta)), self.environment.globalMaxSugar)
+            self.environment.maxWealthTotal += cell.maxSugar - maxSugar
+        if cell.sugar % 1 != 0 or cell.spice % 1 != 0 or cell.maxSugar % 1 != 0 or cell.maxSpice % 1 != 0:
+            self.environment.wealthExact = False
+        cell.resetNeighborWealth()
 
     def configureDepression(self):
         if self.depression == True:
@@ -351,11 +378,17 @@ class Sugarscape:
         # Dummy cell for debugging and for leader agent
         dummyCell = cell.Cell(-1, -1, self.environment)
         self.environment.dummyCell = dummyCell
+        cellClass = cell.Cell
+        if self.configuration["environmentGridMode"] == "arrays":
+            self.environment.resourceGrid = grid.ResourceGrid(self.environment)
+            cellClass = grid.GridCell
+        elif self.configuration["environmentGrowbackMode"] == "lazy":
+            cellClass = cell.LazyCell
 
         if environmentFile == None:
             for i in range(width):
                 for j in range(height):
-                    newCell = cell.Cell(i, j, self.environment)
+                    newCell = cellClass(i, j, self.environment)
                     self.environment.setCell(newCell, i, j)
 
             sugarRadiusScale = 2
@@ -381,10 +414,96 @@ class Sugarscape:
                 for j in range(height):
                     loadSpice = loadEnvironment[i][j]["spice"]
                     loadSugar = loadEnvironment[i][j]["sugar"]
-                    newCell = cell.Cell(i, j, self.environment, loadSpice, loadSugar)
+                    newCell = cellClass(i, j, self.environment, loadSpice, loadSugar)
                     self.environment.setCell(newCell, i, j)
         self.environment.findCellNeighbors()
         self.environment.findCellRanges()
+        self.environment.findWealth()
+
+    def doAgentUpkeep(self):
+        # Only agents which acted this timestep have income, metabolism, and aging left to apply
+        for agent in self.agents:
+            if agent.isAlive() == True and agent.lastMovedTimestep == self.timestep:
+                agent.doUpkeep()
+
+    def doMarketTrading(self):
+        # Clear the market in agent ID order so trades do not depend on the order agents acted in
+        traders = sorted([agent for agent in self.agents if agent.isAlive() == True and agent.tradeFactor != 0], key=lambda agent: agent.ID)
+        for trader in traders:
+            trader.tradeVolume = 0
+            trader.sugarPrice = 0
+            trader.spicePrice = 0
+            trader.findMarginalRateOfSubstitution()
+        # Consider each neighboring pair once, from the agent with the lower ID
+        agentPairs = {trader: [] for trader in traders}
+        pairGaps = {}
+        for trader in traders:
+            for neighborCell in trader.cell.neighbors:
+                partner = neighborCell.agent
+                if partner == None or partner.ID <= trader.ID or partner.tradeFactor == 0 or partner.isAlive() == False:
+                    continue
+                agentPairs[trader].append((trader, partner))
+                agentPairs[partner].append((trader, partner))
+                pairGap = self.findMarketPairGap(trader, partner)
+                if pairGap != None:
+                    pairGaps[(trader, partner)] = pairGap
+        # Keep open pairs sorted by MRS gap, since only the pairs of agents who just traded change between rounds
+        marketPairs = sorted(pairGaps.values())
+        marketTraders = {trader.ID: trader for trader in traders}
+        closedPairs = set()
+        pairTrades = {}
+        welfarePreferences = {}
+        # Pairs in a matching share no agent, so each round of unit transactions could be made in any order
+        matching = self.findMarketMatching(marketPairs, marketTraders)
+        while len(matching) > 0:
+            changedPairs = set()
+            for trader, partner in matching:
+                # MRS > 1 indicates the agent has less need of spice and should become the spice seller
+                if partner.marginalRateOfSubstitution > trader.marginalRateOfSubstitution:
+                    spiceSeller = partner
+                    sugarSeller = trader
+                else:
+                    spiceSeller = trader
+                    sugarSeller = partner
+                sugarPrice, spicePrice = trader.findTradePrices(spiceSeller, sugarSeller)
+                if trader.isTradeAcceptable(spiceSeller, sugarSeller, sugarPrice, spicePrice, welfarePreferences) == True:
+                    if "all" in self.debug or "agent" in self.debug:
+                        print(f"Agent {trader.ID} trading [{sugarPrice}, {spicePrice}]")
+                    trader.doTradeTransaction(spiceSeller, sugarSeller, sugarPrice, spicePrice)
+                    transactions = pairTrades[(trader, partner)]["transactions"] if (trader, partner) in pairTrades else 0
+                    pairTrades[(trader, partner)] = {"sugarPrice": sugarPrice, "spicePrice": spicePrice, "transactions": transactions + 1}
+                    changedPairs.update(agentPairs[trader])
+                    changedPairs.update(agentPairs[partner])
+                else:
+                    closedPairs.add((trader, partner))
+                    changedPairs.add((trader, partner))
+            # Rescore only the pairs of agents whose MRS changed, dropping closed pairs
+            for pair in changedPairs:
+                if pair in pairGaps:
+                    del marketPairs[bisect.bisect_left(marketPairs, pairGaps.pop(pair))]
+                if pair not in closedPairs:
+                    pairGap = self.findMarketPairGap(pair[0], pair[1])
+                    if pairGap != None:
+                        pairGaps[pair] = pairGap
+                        bisect.insort(marketPairs, pairGap)
+            matching = self.findMarketMatching(marketPairs, marketTraders)
+
+        # Log each trading pair once as a trade by the agent with the lower ID, at the price of its last transaction
+        tradePartners = {}
+        for (trader, partner), trade in pairTrades.items():
+            trader.tradeVolume += 1
+            trader.sugarPrice += trade["sugarPrice"]
+            trader.spicePrice += trade["spicePrice"]
+            for agent, other in [(trader, partner), (partner, trader)]:
+                agent.updateTimesTradedWithAgent(other, self.timestep, trade["transactions"])
+                agent.lastTradeTimestep = self.timestep
+                tradePartners[agent] = tradePartners[agent] + 1 if agent in tradePartners else 1
+                if self.experimentalGroup != None and other.isInGroup(self.experimentalGroup):
+                    agent.tradeWithExperimentalGroup += 1
+                elif self.experimentalGroup != None and other.isInGroup(self.experimentalGroup, True):
+                    agent.tradeWithControlGroup += 1
+        for agent, partners in tradePartners.items():
+            agent.lastTradePartners = partners
 
     def doTimestep(self):
         if self.timestep >= self.maxTimestep:
@@ -401,10 +520,16 @@ class Sugarscape:
             self.addRemainingDiseases()
             if self.agentLeader != None:
                 self.agentLeader.doTimestep(self.timestep)
+            if self.agentMovementProcesses > 0:
+                self.findAgentMovePlans()
             for agent in self.agents:
                 if self.agentLeader != None and agent == self.agentLeader:
                     continue
                 agent.doTimestep(self.timestep)
+            if self.agentTradeMode == "market":
+                self.doMarketTrading()
+            if self.agentTimestepMode == "phased":
+                self.doAgentUpkeep()
             self.removeDeadAgents()
             self.replaceDeadAgents()
             self.updateRuntimeStats()
@@ -434,12 +559,10 @@ class Sugarscape:
                 else:
                     logString += f"\t{json.dumps(agentStats)},\n"
         else:
-            environmentWealthCreated = 0
-            environmentWealthTotal = 0
-            for i in range(self.environment.width):
-                for j in range(self.environment.height):
-                    environmentWealthCreated += self.environment.grid[i][j].sugarLastProduced + self.environment.grid[i][j].spiceLastProduced
-                    environmentWealthTotal += self.environment.grid[i][j].sugar + self.environment.grid[i][j].spice
+            environmentWealthCreated = self.environment.wealthCreated
+            environmentWealthTotal = self.environment.wealthTotal
+            if self.environment.wealthExact == False:
+                environmentWealthCreated, environmentWealthTotal = self.environment.findWealthTotals()
             self.runtimeStats["environmentWealthCreated"] = environmentWealthCreated
             self.runtimeStats["environmentWealthTotal"] = environmentWealthTotal
             logString = f"\t{json.dumps(stats)}\n]"
@@ -472,6 +595,18 @@ class Sugarscape:
         if "all" in self.debug or "sugarscape" in self.debug:
             print(str(self))
 
+    def endSnapshot(self, processID, reader):
+        outcome = None
+        try:
+            with os.fdopen(reader, "rb") as pipe:
+                outcome = pickle.load(pipe)
+        # A snapshot process that died before writing leaves an empty or partial outcome
+        except (EOFError, pickle.UnpicklingError):
+            outcome = None
+        finally:
+            exitStatus = os.waitstatus_to_exitcode(os.waitpid(processID, 0)[1])
+        return (outcome, exitStatus)
+
     def findActiveQuadrants(self):
         quadrants = self.configuration["environmentStartingQuadrants"]
         cellRange = []
@@ -496,6 +631,84 @@ class Sugarscape:
             cellRange.append(quadrantFour)
         return cellRange
 
+    def findAgentMovePlans(self):
+        global movePlanningSugarscape
+        tasks = []
+        for i in range(len(self.agents)):
+            agent = self.agents[i]
+            if agent.isAlive() == True and agent != self.agentLeader:
+                # Draw a seed for every agent in shuffled order so plans do not depend on the number of processes
+                tasks.append((i, random.getrandbits(64)))
+        if len(tasks) == 0:
+            return
+        chunkSize = math.ceil(len(tasks) / (self.agentMovementProcesses * 4))
+        chunks = [tasks[i:i + chunkSize] for i in range(0, len(tasks), chunkSize)]
+        # Forked processes share the unchanged simulation as the snapshot every agent plans its move from
+        movePlanningSugarscape = self
+        with multiprocessing.get_context("fork").Pool(self.agentMovementProcesses, initializer=startMovePlanning) as pool:
+            chunkMovePlans = pool.map(findMovePlans, chunks)
+        movePlanningSugarscape = None
+
+        agents = {agent.ID: agent for agent in self.agents}
+        environment = self.environment
+        for movePlans in chunkMovePlans:
+            for agentIndex, preferredCells, rankedCells, neighborhood, state in movePlans:
+                agent = self.agents[agentIndex]
+                agent.movePlan = {"neighborhood": [agents[agentID] for agentID in neighborhood],
+                                  "preferredCells": [(environment.findCell(x, y), agents.get(occupant)) for x, y, occupant in preferredCells],
+                                  "rankedCells": [{"cell": environment.findCell(x, y), "wealth": wealth} for x, y, wealth in rankedCells],
+                                  "state": state}
+
+    def findMarketMatching(self, marketPairs, traders):
+        # Greedily match the pairs furthest apart in MRS first, breaking ties by agent ID
+        matchedAgents = set()
+        matching = []
+        for gap, traderID, partnerID in marketPairs:
+            if traderID not in matchedAgents and partnerID not in matchedAgents:
+                matchedAgents.add(traderID)
+                matchedAgents.add(partnerID)
+                matching.append((traders[traderID], traders[partnerID]))
+        return matching
+
+    def findMarketPairGap(self, trader, partner):
+        # If both trying to sell the same commodity, do not match them
+        if trader.canTradeWithNeighbor(partner) == False or trader.marginalRateOfSubstitution < 0 or partner.marginalRateOfSubstitution < 0:
+            return None
+        return (-1 * abs(trader.marginalRateOfSubstitution - partner.marginalRateOfSubstitution), trader.ID, partner.ID)
+
+    def findSnapshotOutcome(self, simulation):
+        return self.findSnapshotOutcomes([simulation])[0]
+
+    def findSnapshotOutcomes(self, simulations, processes=1):
+        # Without forked processes, fall back to simulating on full copies
+        if hasattr(os, "fork") == False:
+            return [simulation(copy.deepcopy(self)) for simulation in simulations]
+        outcomes = []
+        for i in range(0, len(simulations), processes):
+            snapshots = [self.startSnapshot(simulation) for simulation in simulations[i:i + processes]]
+            batchOutcomes = []
+            failure = None
+            # Close every pipe and reap every snapshot process, even once one has failed
+            try:
+                while len(snapshots) > 0:
+                    processID, reader = snapshots.pop(0)
+                    outcome, exitStatus = self.endSnapshot(processID, reader)
+                    if exitStatus != 0 and failure == None:
+                        failure = (processID, exitStatus, outcome)
+                    batchOutcomes.append(outcome)
+            finally:
+                for processID, reader in snapshots:
+                    os.close(reader)
+                    os.waitpid(processID, 0)
+            # Only raise once every snapshot in the batch has finished
+            if failure != None:
+                processID, exitStatus, outcome = failure
+                if isinstance(outcome, Exception) == True:
+                    raise RuntimeError(f"Snapshot process {processID} failed while simulating") from outcome
+                raise RuntimeError(f"Snapshot process {processID} exited with code {exitStatus} before sending its outcome")
+            outcomes += batchOutcomes
+        return outcomes
+
     def generateAgentID(self):
         agentID = self.nextAgentID
         self.nextAgentID += 1
@@ -904,6 +1117,37 @@ class Sugarscape:
             log.write("[\n")
         self.writeToLog(log)
 
+    def startSnapshot(self, simulation):
+        # A forked process is a copy-on-write snapshot, so what-if changes never need to be copied or rolled back
+        sys.stdout.flush()
+        reader, writer = os.pipe()
+        processID = os.fork()
+        if processID == 0:
+            os.close(reader)
+            exitCode = 1
+            # Keep skipped objects referenced so open logs are never flushed or closed by the snapshot
+            skips = ["gui", "log", "agentLog", "agentLeader"]
+            skipped = [getattr(self, key) for key in skips]
+            try:
+                for key in skips:
+                    setattr(self, key, None)
+                simulated = False
+                try:
+                    outcome = simulation(self)
+                    simulated = True
+                except Exception as error:
+                    outcome = error
+                with os.fdopen(writer, "wb") as pipe:
+                    pickle.dump(outcome, pipe)
+                sys.stdout.flush()
+                # Only report success once the outcome has been fully sent
+                if simulated == True:
+                    exitCode = 0
+            finally:
+                os._exit(exitCode)
+        os.close(writer)
+        return (processID, reader)
+
     def toggleEnd(self):
         self.end = True
 
@@ -1041,14 +1285,13 @@ class Sugarscape:
         if self.timestep == 0:
             carryingCapacity = len(self.agents)
 
-        environmentWealthCreated = 0
-        environmentWealthTotal = 0
-        for i in range(self.environment.width):
-            for j in range(self.environment.height):
-                environmentWealthCreated += self.environment.grid[i][j].sugarLastProduced + self.environment.grid[i][j].spiceLastProduced
-                environmentWealthTotal += self.environment.grid[i][j].sugar + self.environment.grid[i][j].spice
-                if self.timestep == 1:
-                    environmentWealthCreated += self.environment.grid[i][j].maxSugar + self.environment.grid[i][j].maxSpice
+        environmentWealthCreated = self.environment.wealthCreated
+        environmentWealthTotal = self.environment.wealthTotal
+        # Fractional resource amounts make running totals drift from a cell by cell sum, so recount them instead
+        if self.environment.wealthExact == False:
+            environmentWealthCreated, environmentWealthTotal = self.environment.findWealthTotals(self.timestep == 1)
+        elif self.timestep == 1:
+            environmentWealthCreated += self.environment.maxWealthTotal
 
         agentAgingDeaths = 0
         agentCombatDeaths = 0
@@ -1460,6 +1703,38 @@ class Sugarscape:
         string = f"{str(self.environment)}Seed: {self.seed}\nTimestep: {self.timestep}\nLiving Agents: {len(self.agents)}"
         return string
 
+def findMovePlans(tasks):
+    sugarscape = movePlanningSugarscape
+    movePlans = []
+    for agentIndex, seed in tasks:
+        agent = sugarscape.agents[agentIndex]
+        # Plan from the forked state since planning other agents may have updated this agent, such as its time to live
+        agentState = movePlanningAgentStates[agentIndex]
+        vars(agent).clear()
+        vars(agent).update(agentState)
+        random.seed(seed)
+        bestCell = agent.findBestCell()
+        # Agents with no cells in range only rank their own cell and leave their valid moves unchanged
+        validMoves = agent.validMoves if len(agent.cellsInRange) > 0 else [{"cell": agent.cell, "wealth": 0}]
+        rankedCells = [(cell["cell"].x, cell["cell"].y, cell["wealth"]) for cell in validMoves]
+        preferredCells = [(bestCell.x, bestCell.y)]
+        # Agents choosing by decision model only judged their chosen cell, so they stay put rather than fall back on cells ranked by wealth alone
+        if agentState["decisionModelFactor"] <= 0:
+            preferredCells += [(x, y) for x, y, wealth in rankedCells if x != bestCell.x or y != bestCell.y]
+        # Keep the occupant of each preferred cell so only the prey judged while planning can be attacked
+        for i in range(len(preferredCells)):
+            x, y = preferredCells[i]
+            occupant = sugarscape.environment.findCell(x, y).agent
+            preferredCells[i] = (x, y, occupant.ID if occupant != None else None)
+        neighborhood = [neighbor.ID for neighbor in agent.neighborhood]
+        # Only simple values changed while planning, such as decision model factors, are carried back to the agent
+        state = {attribute: value for attribute, value in vars(agent).items() if type(value) in [bool, float, int, str] and agentState.get(attribute) != value}
+        # Undo planning so agents planned later in the same process see the same snapshot as in any other process
+        vars(agent).clear()
+        vars(agent).update(agentState)
+        movePlans.append((agentIndex, preferredCells, rankedCells, neighborhood, state))
+    return movePlans
+
 def parseConfiguration(configFile, configuration):
     file = open(configFile)
     options = json.loads(file.read())
@@ -1529,8 +1804,12 @@ def sortConfigurationTimeframes(configuration, timeframe):
         config = [start, end]
     return config
 
+def startMovePlanning():
+    global movePlanningAgentStates
+    movePlanningAgentStates = [dict(vars(agent)) for agent in movePlanningSugarscape.agents]
+
 def verifyConfiguration(configuration):
-    negativesAllowed = ["agentDecisionModelAgeismFactor", "agentDecisionModelRacismFactor", "agentDecisionModelSexismFactor", "agentDecisionModelTribalFactor", "agentMaxAge", "agentSelfishnessFactor"]
+    negativesAllowed = ["agentDecisionModelAgeismFactor", "agentDecisionModelRacismFactor", "agentDecisionModelSexismFactor", "agentDecisionModelTribalFactor", "agentLeaderSearchBudget", "agentMaxAge", "agentSelfishnessFactor"]
     negativesAllowed += ["diseaseAggressionPenalty", "diseaseFertilityPenalty", "diseaseFriendlinessPenalty", "diseaseHappinessPenalty", "diseaseMovementPenalty"]
     negativesAllowed += ["diseaseSpiceMetabolismPenalty", "diseaseSugarMetabolismPenalty", "diseaseTimeframe", "diseaseVisionPenalty"]
     negativesAllowed += ["environmentAgeistAbsoluteRanges", "environmentAgeistRelativeRange", "environmentEquator", "environmentPollutionDiffusionTimeframe", "environmentPollutionTimeframe", "environmentMaxSpice", "environmentMaxSugar"]
@@ -1610,6 +1889,20 @@ def verifyConfiguration(configuration):
             print(f"Cannot have a quadrant size factor of {configuration['environmentQuadrantSizeFactor']}. Setting quadrant size factor to 1.")
         configuration["environmentQuadrantSizeFactor"] = 1
 
+    if configuration["environmentGridMode"] not in ["arrays", "cells"]:
+        if "all" in configuration["debugMode"] or "environment" in configuration["debugMode"]:
+            print(f"Cannot have environment grid mode {configuration['environmentGridMode']}. Setting environment grid mode to cells.")
+        configuration["environmentGridMode"] = "cells"
+
+    if configuration["environmentGrowbackMode"] not in ["eager", "lazy"]:
+        if "all" in configuration["debugMode"] or "environment" in configuration["debugMode"]:
+            print(f"Cannot have environment growback mode {configuration['environmentGrowbackMode']}. Setting environment growback mode to eager.")
+        configuration["environmentGrowbackMode"] = "eager"
+    elif configuration["environmentGrowbackMode"] == "lazy" and configuration["environmentGridMode"] == "arrays":
+        if "all" in configuration["debugMode"] or "environment" in configuration["debugMode"]:
+            print("Cannot have lazy environment growback with an array-backed environment grid. Setting environment growback mode to eager.")
+        configuration["environmentGrowbackMode"] = "eager"
+
     if len(configuration["environmentStartingQuadrants"]) == 0:
         configuration["environmentStartingQuadrants"] = [1, 2, 3, 4]
 
@@ -1707,6 +2000,34 @@ def verifyConfiguration(configuration):
             print(f"Cannot have agent maximum dynamic social pressure factor of {configuration['agentDynamicSocialPressureFactor'][1]}. Setting agent maximum dynamic social change to 1.0.")
         configuration["agentDynamicSocialPressureFactor"][1] = 1.0
 
+    if configuration["agentLeaderSearch"] not in ["exhaustive", "greedy", "sampled"]:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent leader search {configuration['agentLeaderSearch']}. Setting agent leader search to exhaustive.")
+        configuration["agentLeaderSearch"] = "exhaustive"
+
+    if configuration["agentLeaderSearchBudget"] < 1 and configuration["agentLeaderSearchBudget"] != -1:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent leader search budget of {configuration['agentLeaderSearchBudget']}. Setting agent leader search budget to unlimited.")
+        configuration["agentLeaderSearchBudget"] = -1
+
+    if configuration["agentLeaderSearchProcesses"] < 1:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have fewer than one agent leader search process. Setting agent leader search processes to 1.")
+        configuration["agentLeaderSearchProcesses"] = 1
+
+    if configuration["agentMovementProcesses"] < 0:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have a negative number of agent movement processes. Setting agent movement processes to 0.")
+        configuration["agentMovementProcesses"] = 0
+    elif configuration["agentMovementProcesses"] > 0 and configuration["agentLeader"] == True:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent movement processes with an agent leader. Setting agent movement processes to 0.")
+        configuration["agentMovementProcesses"] = 0
+    elif configuration["agentMovementProcesses"] > 0 and "fork" not in multiprocessing.get_all_start_methods():
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent movement processes without forked processes. Setting agent movement processes to 0.")
+        configuration["agentMovementProcesses"] = 0
+
     if configuration["agentRacialTagStringLength"] < 0:
         if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
             print(f"Cannot have a negative agent racial tag string length. Setting agent racial tag string length to 0.")
@@ -1717,6 +2038,16 @@ def verifyConfiguration(configuration):
             print(f"Cannot have a negative agent tag string length. Setting agent tag string length to 0.")
         configuration["agentTagStringLength"] = 0
 
+    if configuration["agentTimestepMode"] not in ["phased", "sequential"]:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent timestep mode {configuration['agentTimestepMode']}. Setting agent timestep mode to sequential.")
+        configuration["agentTimestepMode"] = "sequential"
+
+    if configuration["agentTradeMode"] not in ["market", "pairwise"]:
+        if "all" in configuration["debugMode"] or "agent" in configuration["debugMode"]:
+            print(f"Cannot have agent trade mode {configuration['agentTradeMode']}. Setting agent trade mode to pairwise.")
+        configuration["agentTradeMode"] = "pairwise"
+
     if configuration["environmentMaxRaces"] < 0:
         if "all" in configuration["debugMode"] or "environment" in configuration["debugMode"]:
             print(f"Cannot have a negative number of races. Setting number of races to 0.")
@@ -1862,6 +2193,9 @@ if __name__ == "__main__":
                      "agentImmuneSystemLength": 0,
                      "agentInheritancePolicy": "none",
                      "agentLeader": False,
+                     "agentLeaderSearch": "exhaustive",
+                     "agentLeaderSearchBudget": -1,
+                     "agentLeaderSearchProcesses": 1,
                      "agentLendingFactor": [0, 0],
                      "agentLoanDuration": [0, 0],
                      "agentLogfile": None,
@@ -1873,6 +2207,7 @@ if __name__ == "__main__":
                      "agentMaxFriends": [0, 0],
                      "agentMovement": [1, 6],
                      "agentMovementMode": "cardinal",
+                     "agentMovementProcesses": 0,
                      "agentRacialTagStringLength": 0,
                      "agentReplacements": 0,
                      "agentSelfishnessFactor": [-1, -1],
@@ -1884,7 +2219,9 @@ if __name__ == "__main__":
                      "agentTagPreferences": False,
                      "agentTagStringLength": 0,
                      "agentTemperanceFactor": [0,0],
+                     "agentTimestepMode": "sequential",
                      "agentTradeFactor": [0, 0],
+                     "agentTradeMode": "pairwise",
                      "agentUniversalSpice": [0,0],
                      "agentUniversalSugar": [0,0],
                      "agentVision": [1, 6],
@@ -1907,6 +2244,8 @@ if __name__ == "__main__":
                      "environmentAgeistRelativeRange": -1,
                      "environmentEquator": -1,
                      "environmentFile": None,
+                     "environmentGridMode": "cells",
+                     "environmentGrowbackMode": "eager",
                      "environmentHeight": 50,
                      "environmentInGroupRaces": [],
                      "environmentMaxCombatLoot": 0,
@@ -1957,6 +2296,8 @@ if __name__ == "__main__":
     configuration = verifyConfiguration(configuration)
     if configuration["headlessMode"] == False:
         import gui
+    if configuration["environmentGridMode"] == "arrays":
+        import grid
     S = Sugarscape(configuration)
     if configuration["profileMode"] == True:
         import cProfile